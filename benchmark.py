@@ -0,0 +1,1038 @@
+import os
+import re
+import sys
+import time
+import random
+import subprocess
+import shutil
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+from pathlib import Path
+from literal_decoder import decode_c_literal, decode_c_literals, decode_go_literal, decode_python_literal
+from literal_decoder import decode_cpp_char_array, decode_cpp_string_literals
+from literal_decoder import decode_go_literals
+from source_scanner import locate_all
+from descriptor_extractor import parse_go_byte_array, GO_ANCHOR, _scan_go
+from proto_generator import generate_message, get_field_label, get_simple_type_name
+from proto_generator import generate_proto_from_bytes, generate_proto_from_descriptor
+from proto_generator import generate_proto_content, write_proto_content
+from proto_writer import render_descriptors, stream_pb_file, render_pb_file, detect_proto_name
+from descriptor_index import FileSelection
+from output_writer import OutputWriter
+from parallel_render import stream_pb_file_parallel
+import render_cache
+import google.protobuf.descriptor_pb2 as descriptor_pb2
+
+# 基准测试: python benchmark.py [名称 ...]
+# 旧实现原样保留在这里，用来对比速度并校验新实现的输出
+
+def legacy_process_escape_sequences(escaped_string, supports_unicode=True):
+    if supports_unicode:
+        def replace_unicode(match):
+            hex_str = match.group(1)
+            if len(hex_str) % 2 != 0:
+                hex_str = '0' + hex_str
+
+            return bytes.fromhex(hex_str).decode('latin-1')
+
+        escaped_string = re.sub(
+            r"\\u([0-9a-fA-F]{4})",
+            replace_unicode,
+            escaped_string
+        )
+
+        escaped_string = re.sub(
+            r"\\U([0-9a-fA-F]{8})",
+            replace_unicode,
+            escaped_string
+        )
+
+        if '\\x{' in escaped_string:
+            escaped_string = re.sub(
+                r"\\x\{([0-9a-fA-F]{2,6})\}",
+                replace_unicode,
+                escaped_string
+            )
+
+    def replace_octal(match):
+        octal_str = match.group(1)
+        char_code = int(octal_str, 8)
+        return chr(char_code) if char_code < 256 else f"\\{octal_str}"
+
+    escaped_string = re.sub(
+        r"\\([0-7]{1,3})",
+        replace_octal,
+        escaped_string
+    )
+
+    def replace_hex(match):
+        hex_str = match.group(1)
+        char_code = int(hex_str, 16)
+        return chr(char_code)
+
+    escaped_string = re.sub(
+        r"\\x([0-9a-fA-F]{2})",
+        replace_hex,
+        escaped_string
+    )
+
+    simple_escapes = {
+        "\\a": "\a",
+        "\\b": "\b",
+        "\\f": "\f",
+        "\\n": "\n",
+        "\\r": "\r",
+        "\\t": "\t",
+        "\\\"": "\"",
+        "\\'": "'",
+        "\\\\": "\\",
+        "\\v": "\v",
+        "\\0": "\0",
+        '\\$': '$',
+        '\\{': '{',
+        '\\}': '}',
+        "\\e": "\x1b",
+        "\\?": "?",
+    }
+
+    for esc, replacement in simple_escapes.items():
+        escaped_string = escaped_string.replace(esc, replacement)
+
+    return escaped_string
+
+def legacy_process_go_escape_sequences(s: str) -> bytes:
+    out = bytearray()
+    i = 0
+    n = len(s)
+
+    while i < n:
+        c = s[i]
+
+        # 普通字符，UTF-8 编码
+        if c != '\\':
+            out.extend(c.encode('utf-8'))
+            i += 1
+            continue
+
+        # 处理转义
+        i += 1
+        if i >= n:
+            raise ValueError("Incomplete escape sequence")
+
+        esc = s[i]
+        i += 1
+
+        if esc == 'a':
+            out.append(0x07)
+        elif esc == 'b':
+            out.append(0x08)
+        elif esc == 'f':
+            out.append(0x0C)
+        elif esc == 'n':
+            out.append(0x0A)
+        elif esc == 'r':
+            out.append(0x0D)
+        elif esc == 't':
+            out.append(0x09)
+        elif esc == 'v':
+            out.append(0x0B)
+        elif esc == '\\':
+            out.append(0x5C)
+        elif esc == '"':
+            out.append(0x22)
+        elif esc == "'":
+            out.append(0x27)
+
+        # 八进制 \NNN（最多 3 位）
+        elif esc in '01234567':
+            digits = esc
+            for _ in range(2):
+                if i < n and s[i] in '01234567':
+                    digits += s[i]
+                    i += 1
+                else:
+                    break
+            val = int(digits, 8)
+            if val > 255:
+                raise ValueError("Octal escape out of range")
+            out.append(val)
+
+        # 十六进制 \xNN（单字节）
+        elif esc == 'x':
+            if i + 1 >= n:
+                raise ValueError("Incomplete \\x escape")
+            hex_digits = s[i:i+2]
+            out.append(int(hex_digits, 16))
+            i += 2
+
+        # Unicode \uXXXX
+        elif esc == 'u':
+            hex_digits = s[i:i+4]
+            codepoint = int(hex_digits, 16)
+            out.extend(chr(codepoint).encode('utf-8'))
+            i += 4
+
+        # Unicode \UNNNNNNNN
+        elif esc == 'U':
+            hex_digits = s[i:i+8]
+            codepoint = int(hex_digits, 16)
+            if codepoint > 0x10FFFF:
+                raise ValueError("Unicode out of range")
+            out.extend(chr(codepoint).encode('utf-8'))
+            i += 8
+
+        else:
+            raise ValueError(f"Unknown escape sequence: \\{esc}")
+
+    return bytes(out)
+
+def legacy_locate_go_const(go_code):
+    const_match = re.search(r'const\s+file_\w+_proto_rawDesc\s*=', go_code)
+    if const_match:
+        remaining_code = go_code[const_match.end():]
+        return re.findall(r'"((?:\\.|[^"\\])*)"', remaining_code)
+    return None
+
+def legacy_generate_message(message_desc, lines, indent_level):
+    indent = "    " * indent_level
+    lines.append(f"{indent}message {get_simple_type_name(message_desc.name)} {{")
+
+    for nested in message_desc.nested_type:
+        if nested.options.map_entry:
+            map_field = None
+            for field in message_desc.field:
+                if field.type_name.endswith(nested.name):
+                    map_field = field
+                    break
+            if map_field:
+                key_type = legacy_get_field_type(nested.field[0])
+                value_type = legacy_get_field_type(nested.field[1])
+                lines.append(f"{indent}    map<{key_type}, {value_type}> {map_field.name} = {map_field.number};")
+
+    for field in message_desc.field:
+        if field.HasField("oneof_index"):
+            continue
+        if any(nested.options.map_entry and field.type_name.endswith(nested.name) for nested in message_desc.nested_type):
+            continue
+        field_type = legacy_get_field_type(field)
+        lines.append(f"{indent}    {get_field_label(field)}{field_type} {field.name} = {field.number};")
+
+    if message_desc.oneof_decl:
+        oneof_groups = {}
+        for field in message_desc.field:
+            if field.HasField("oneof_index"):
+                oneof_groups.setdefault(field.oneof_index, []).append(field)
+        for index, fields in oneof_groups.items():
+            lines.append(f"{indent}    oneof {message_desc.oneof_decl[index].name} {{")
+            for field in fields:
+                lines.append(f"{indent}        {legacy_get_field_type(field)} {field.name} = {field.number};")
+            lines.append(f"{indent}    }}")
+
+    for nested in message_desc.nested_type:
+        if not nested.options.map_entry:
+            legacy_generate_message(nested, lines, indent_level + 1)
+
+    lines.append(f"{indent}}}")
+    lines.append("")
+
+def legacy_get_field_type(field):
+    if field.HasField("type_name"):
+        return get_simple_type_name(field.type_name)
+
+    type_mapping = {
+        field.TYPE_DOUBLE: "double",
+        field.TYPE_FLOAT: "float",
+        field.TYPE_INT64: "int64",
+        field.TYPE_UINT64: "uint64",
+        field.TYPE_INT32: "int32",
+        field.TYPE_FIXED64: "fixed64",
+        field.TYPE_FIXED32: "fixed32",
+        field.TYPE_BOOL: "bool",
+        field.TYPE_STRING: "string",
+        field.TYPE_BYTES: "bytes",
+        field.TYPE_UINT32: "uint32",
+        field.TYPE_SFIXED32: "sfixed32",
+        field.TYPE_SFIXED64: "sfixed64",
+        field.TYPE_SINT32: "sint32",
+        field.TYPE_SINT64: "sint64",
+    }
+    return type_mapping.get(field.type, "unknown")
+
+def legacy_parse_go_byte_array(byte_array):
+    byte_array = byte_array.replace('\n', '')
+    byte_array = byte_array.replace(' ', '')
+    byte_array = byte_array.strip()
+
+    byte_strs = byte_array.split(',')
+    data = bytearray()
+
+    for byte_str in byte_strs:
+        byte_str = byte_str.strip()
+        if not byte_str:
+            continue
+
+        if byte_str.startswith('0x'):
+            try:
+                hex_str = byte_str[2:]
+                if len(hex_str) == 1:
+                    hex_str = '0' + hex_str
+                data.append(int(hex_str, 16))
+            except ValueError:
+                print(f"Invalid hex byte: {byte_str}")
+                return None
+        else:
+            try:
+                value = int(byte_str)
+                if value < 0 or value > 255:
+                    print(f"Byte value out of range: {value}")
+                    return None
+                data.append(value)
+            except ValueError:
+                print(f"Invalid decimal byte: {byte_str}")
+                return None
+
+    return bytes(data)
+
+def legacy_decode_cpp_char_array(array_content):
+    full_bytes = bytearray()
+
+    char_pattern = re.compile(
+        r"'("
+        r"(?:"
+        r"\\['\"\\?abfnrtv]|"
+        r"\\[0-7]{1,3}|"
+        r"\\x[0-9a-fA-F]{2}|"
+        r"\\u[0-9a-fA-F]{4}|"
+        r"\\U[0-9a-fA-F]{8}|"
+        r"\\\\|"
+        r"."
+        r")"
+        r")\s*?'",
+        re.DOTALL
+    )
+
+    for char_match in char_pattern.findall(array_content):
+        processed_char = legacy_process_escape_sequences(char_match, supports_unicode=False)
+        for char in processed_char:
+            full_bytes.append(ord(char) & 0xFF)
+
+    return bytes(full_bytes)
+
+def legacy_decode_cpp_string_literals(array_content):
+    full_string = ""
+    string_pattern = re.compile(r'"((?:\\"|[^"])*)"', re.DOTALL)
+    for match in string_pattern.finditer(array_content):
+        full_string += match.group(1)
+    return legacy_process_escape_sequences(full_string).encode("latin-1")
+
+# strconv.Unquote 的对照样例: (字面量内容, 期望字节)，期望为 None 表示 Go 会报错
+GO_UNQUOTE_CORPUS = [
+    ("", b""),
+    ("abc", b"abc"),
+    ("\\a\\b\\f\\n\\r\\t\\v\\\\\\\"", b"\a\b\f\n\r\t\v\\\""),
+    ("\\000\\101\\377", b"\x00A\xff"),
+    ("\\x00\\x7f\\xFF\\xab", b"\x00\x7f\xff\xab"),
+    ("\\u00e9\\u65e5", "\u00e9\u65e5".encode("utf-8")),
+    ("\\U0001F600", "\U0001F600".encode("utf-8")),
+    ("\u65e5\u672c", "\u65e5\u672c".encode("utf-8")),
+    ("\\\\n", b"\\n"),
+    ("\\\\\\x41", b"\\A"),
+    ("\\1\\\\23", None),
+    ("\\1014", b"A4"),
+    ("\\x414", b"A4"),
+    ("\\400", None),
+    ("\\12", None),
+    ("\\8", None),
+    ("\\'", None),
+    ("\\q", None),
+    ("\\x4", None),
+    ("\\x4G", None),
+    ("\\u12", None),
+    ("\\uD800", None),
+    ("\\U00110000", None),
+    ("abc\\", None),
+]
+
+def go_escape(data):
+    # protoc-gen-go 的输出风格
+    parts = []
+    for byte in data:
+        if byte in (0x22, 0x5C):
+            parts.append("\\" + chr(byte))
+        elif 0x20 <= byte < 0x7F:
+            parts.append(chr(byte))
+        else:
+            parts.append("\\x%02x" % byte)
+    return "".join(parts)
+
+def check_go_corpus():
+    for literal, expected in GO_UNQUOTE_CORPUS:
+        try:
+            actual = decode_go_literal(literal)
+        except ValueError:
+            actual = None
+        if actual != expected:
+            raise AssertionError(f"Go literal {literal!r}: expected {expected!r}, got {actual!r}")
+
+    # 随机组合合法转义，与旧实现逐一比对
+    rng = random.Random(1)
+    pieces = ["a", "Z", " ", "\u65e5", "\\n", "\\t", "\\\\", "\\\"", "\\000", "\\377", "\\x1f", "\\xAB", "\\u00e9", "\\U0001F600"]
+    for _ in range(2000):
+        literal = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+        expected = legacy_process_go_escape_sequences(literal)
+        actual = decode_go_literal(literal)
+        if actual != expected:
+            raise AssertionError(f"Go literal {literal!r}: expected {expected!r}, got {actual!r}")
+
+    return len(GO_UNQUOTE_CORPUS) + 2000
+
+def synthetic_descriptor(size, seed=0):
+    # 近似真实描述符: 大部分是标识符文本，夹杂长度前缀、tag 等二进制字节
+    rng = random.Random(seed)
+    words = [b"Player", b"uid", b"nick", b"items", b"google/protobuf", b"game.battle", b"CMD_", b"Entry", b"value"]
+    out = bytearray()
+    while len(out) < size:
+        if rng.random() < 0.5:
+            out += rng.choice(words)
+        else:
+            out += bytes(rng.randrange(256) for _ in range(rng.randint(1, 4)))
+    return bytes(out[:size])
+
+def octal_escape(data):
+    # protoc 的 CEscape 风格
+    parts = []
+    for byte in data:
+        if byte == 0x22:
+            parts.append('\\"')
+        elif byte == 0x27:
+            parts.append("\\'")
+        elif byte == 0x5C:
+            parts.append("\\\\")
+        elif byte == 0x0A:
+            parts.append("\\n")
+        elif 0x20 <= byte < 0x7F:
+            parts.append(chr(byte))
+        else:
+            parts.append("\\%03o" % byte)
+    return "".join(parts)
+
+def hex_escape(data):
+    parts = []
+    for byte in data:
+        if byte in (0x22, 0x24, 0x5C):
+            parts.append("\\" + chr(byte))
+        elif 0x20 <= byte < 0x7F:
+            parts.append(chr(byte))
+        else:
+            parts.append("\\x%02x" % byte)
+    return "".join(parts)
+
+def best_time(func, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def child_peak_rss(code):
+    # protobuf 的 C 实现自己分配内存，tracemalloc 看不到，在子进程里运行后读取其峰值 RSS (KB)。
+    # Linux 上子进程的峰值 RSS 从 fork 时的父进程 RSS 算起，调用前主进程不要占用大量内存
+    script = f"{code}\nimport resource\nprint(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__) or None
+    )
+    return int(result.stdout.split()[-1]) * 1024
+
+def report(name, size, old_time, new_time):
+    speed = size / new_time / (1 << 20)
+    if old_time is None:
+        print(f"  {name:<28} new {new_time * 1000:9.2f} ms  ({speed:8.1f} MB/s)")
+        return
+    print(
+        f"  {name:<28} old {old_time * 1000:9.2f} ms  new {new_time * 1000:9.2f} ms  "
+        f"({speed:8.1f} MB/s, {old_time / new_time:5.1f}x)"
+    )
+
+def legacy_get_csharp_proto_name(source_code):
+    # 旧实现: 解码整个源码后在全文上搜索
+    csharp_code = bytes(source_code).decode("utf-8", errors="replace")
+    source_match = re.search(r'^//\s*source:\s*(.+?\.proto)\s*$', csharp_code, re.MULTILINE)
+    if source_match:
+        return Path(source_match.group(1)).name
+
+    match = re.compile(r'public\s+static\s+partial\s+class\s+(\w+)Reflection\b').search(csharp_code)
+    if match:
+        return f"{match.group(1)}.proto"
+    return None
+
+# 成对的反斜杠两侧不能拼成一个转义
+C_ESCAPE_CORPUS = [
+    (rb"\x4\\F", "cpp", b"\x04\\F"),
+    (rb"\x4\\F", "ruby", b"\x04\\F"),
+    (rb"\x4\\F", "php", b"\x04\\F"),
+    (rb"\1\\23", "java", b"\x01\\23"),
+]
+
+def check_c_corpus():
+    for literal, dialect, expected in C_ESCAPE_CORPUS:
+        actual = decode_c_literal(literal, dialect)
+        if actual != expected:
+            raise AssertionError(f"{dialect} literal {literal!r}: expected {expected!r}, got {actual!r}")
+
+def bench_escape(size):
+    print(f"escape: C-style literal decoding, {size} byte descriptor")
+    check_c_corpus()
+    data = synthetic_descriptor(size)
+
+    cases = [
+        ("java (octal)", octal_escape(data), "java"),
+        ("python (bytes repr)", repr(data)[2:-1], "python"),
+        ("ruby (hex)", hex_escape(data), "ruby"),
+        ("php (hex)", hex_escape(data), "php"),
+        ("cpp (octal)", octal_escape(data), "cpp"),
+    ]
+    for name, escaped, dialect in cases:
+        decoded = decode_c_literal(escaped, dialect)
+        if decoded != data:
+            raise AssertionError(f"{name}: decoded output does not match the original bytes")
+
+        old_time = best_time(lambda: legacy_process_escape_sequences(escaped).encode("latin-1"))
+        new_time = best_time(decode_c_literal, escaped, dialect)
+        report(name, size, old_time, new_time)
+
+    # protoc 会把很长的字面量拆成多段
+    fragments = [octal_escape(data[i:i + 40]) for i in range(0, len(data), 40)]
+    new_time = best_time(decode_c_literals, fragments, "java")
+    report("java (40-byte fragments)", size, None, new_time)
+
+def bench_python(size):
+    print(f"python: _pb2 AddSerializedFile literal, {size} byte descriptor")
+    data = synthetic_descriptor(size)
+    literal = repr(data)
+    escaped = literal[2:-1]
+
+    decoded = decode_python_literal(literal)
+    if decoded != data:
+        raise AssertionError("ast.literal_eval output does not match the original bytes")
+
+    old_time = best_time(lambda: legacy_process_escape_sequences(escaped).encode("latin-1"))
+    report("decode_c_literal", size, old_time, best_time(decode_c_literal, escaped, "python"))
+    report("ast.literal_eval", size, old_time, best_time(decode_python_literal, literal))
+
+    # 非 protoc 风格但合法的写法: 反斜杠后紧跟 x 与八进制数字
+    tricky = r"b'\\x41\\101\x41\101\1234'"
+    if decode_python_literal(tricky) != eval(tricky):
+        raise AssertionError("ast.literal_eval disagrees with the interpreter")
+
+def bench_go(size):
+    print(f"go: Go string literal decoding, {size} byte descriptor")
+    print(f"  differential corpus: {check_go_corpus()} literals match strconv.Unquote semantics")
+
+    data = synthetic_descriptor(size)
+    cases = [
+        ("protoc-gen-go (\\xHH)", go_escape(data)),
+        ("with \\u escapes", go_escape(data).replace("Player", "\\u00e9Player")),
+    ]
+    for name, escaped in cases:
+        decoded = decode_go_literal(escaped)
+        if decoded != legacy_process_go_escape_sequences(escaped):
+            raise AssertionError(f"{name}: decoded output does not match the previous implementation")
+
+        old_time = best_time(legacy_process_go_escape_sequences, escaped)
+        new_time = best_time(decode_go_literal, escaped)
+        report(name, size, old_time, new_time)
+
+def go_const_source(data, trailing_lines):
+    # protoc-gen-go 1.36 的排版: 每个字段描述一行 "..." +，后面是大量生成代码
+    escaped = [go_escape(data[i:i + 48]) for i in range(0, len(data), 48)]
+    lines = ["const file_bench_proto_rawDesc = \"\" +"]
+    lines.extend(f'\t"{fragment}" +' for fragment in escaped[:-1])
+    lines.append(f'\t"{escaped[-1]}"')
+    lines.extend(f'var x{i} = fmt.Sprintf("field %d", {i})' for i in range(trailing_lines))
+    return "\n".join(lines)
+
+def bench_go_const(size):
+    print(f"go-const: locating a const rawDesc literal run, {size} byte descriptor")
+    data = synthetic_descriptor(size)
+    go_code = go_const_source(data, 50000)
+    code = go_code.encode("utf-8")
+
+    def locate():
+        return list(locate_all(code, GO_ANCHOR, _scan_go))
+
+    (_, fragments), = locate()
+    if decode_go_literals(fragments) != data:
+        raise AssertionError("decoded output does not match the original bytes")
+
+    legacy = legacy_locate_go_const(go_code)
+    print(f"  fragments: old {len(legacy)} (includes strings after the constant), new {len(fragments)}")
+
+    old_time = best_time(legacy_locate_go_const, go_code)
+    new_time = best_time(locate)
+    report("locate", len(code), old_time, new_time)
+
+    old_peak = peak_memory(legacy_locate_go_const, go_code)
+    new_peak = peak_memory(locate)
+    print(f"  {'':<28} peak memory old {old_peak / (1 << 20):7.1f} MB  new {new_peak / (1 << 20):7.1f} MB")
+
+def go_byte_array(data, fmt="0x%02x"):
+    # 旧版 protoc-gen-go 的 []byte{...} 排版: 每行 16 个字节
+    lines = []
+    for i in range(0, len(data), 16):
+        lines.append("\t" + ", ".join(fmt % byte for byte in data[i:i + 16]) + ",")
+    return "\n" + "\n".join(lines) + "\n"
+
+def bench_go_bytes(size):
+    size = max(size, 1 << 20)
+    print(f"go-bytes: Go []byte{{...}} descriptor arrays, {size} bytes")
+    data = synthetic_descriptor(size)
+
+    cases = [
+        ("hex (0x%02x)", go_byte_array(data)),
+        ("decimal", go_byte_array(data, "%d")),
+        ("mixed widths (0x%x)", go_byte_array(data, "0x%x")),
+    ]
+    for name, content in cases:
+        if parse_go_byte_array(content) != data or legacy_parse_go_byte_array(content) != data:
+            raise AssertionError(f"{name}: parsed output does not match the original bytes")
+
+        old_time = best_time(legacy_parse_go_byte_array, content)
+        new_time = best_time(parse_go_byte_array, content)
+        report(name, size, old_time, new_time)
+
+def cpp_char_array(data):
+    # protoc 超长描述符的 char 数组写法
+    def char(byte):
+        if byte == 0x27:
+            return "'\\''"
+        if byte == 0x5C:
+            return "'\\\\'"
+        if byte == 0x0A:
+            return "'\\n'"
+        if 0x20 <= byte < 0x7F:
+            return f"'{chr(byte)}'"
+        return "'\\%03o'" % byte
+
+    lines = []
+    for i in range(0, len(data), 20):
+        lines.append("  " + ", ".join(char(byte) for byte in data[i:i + 20]) + ",")
+    return "\n".join(lines)
+
+def cpp_string_literals(data):
+    escaped = octal_escape(data)
+    lines = []
+    start = 0
+    while start < len(escaped):
+        end = min(start + 400, len(escaped))
+        # 不要把转义序列从中间切开
+        while escaped.rfind("\\", start, end) > end - 4 and end < len(escaped):
+            end += 1
+        lines.append(f'  "{escaped[start:end]}"')
+        start = end
+    return "\n".join(lines)
+
+def bench_cpp(size):
+    print(f"cpp: descriptor_table_protodef_ arrays, {size} byte descriptor")
+    data = synthetic_descriptor(size)
+
+    cases = [
+        ("char array", cpp_char_array(data), legacy_decode_cpp_char_array, decode_cpp_char_array),
+        ("string literals", cpp_string_literals(data), legacy_decode_cpp_string_literals, decode_cpp_string_literals),
+    ]
+    for name, content, legacy, current in cases:
+        if current(content) != data:
+            raise AssertionError(f"{name}: decoded output does not match the original bytes")
+
+        old_time = best_time(legacy, content, repeat=3)
+        new_time = best_time(current, content, repeat=3)
+        report(name, size, old_time, new_time)
+
+        old_peak = peak_memory(legacy, content)
+        new_peak = peak_memory(current, content)
+        print(f"  {'':<28} peak memory old {old_peak / (1 << 20):7.1f} MB  new {new_peak / (1 << 20):7.1f} MB")
+
+def add_fields(message, full_name, field_count, map_count, oneof_count):
+    FieldDescriptorProto = descriptor_pb2.FieldDescriptorProto
+    number = 0
+
+    # map 名互为后缀 (ItemsEntry / OtherItemsEntry ...)，旧实现按 endswith 匹配会配错字段
+    for index in range(map_count):
+        entry_name = "Other" * (index % 3) + f"Items{index // 3}Entry"
+        entry = message.nested_type.add(name=entry_name)
+        entry.options.map_entry = True
+        entry.field.add(name="key", number=1, type=FieldDescriptorProto.TYPE_STRING)
+        entry.field.add(name="value", number=2, type=FieldDescriptorProto.TYPE_INT64)
+
+    for index in reversed(range(map_count)):
+        number += 1
+        message.field.add(
+            name=f"map_{index}", number=number, label=FieldDescriptorProto.LABEL_REPEATED,
+            type=FieldDescriptorProto.TYPE_MESSAGE, type_name=f"{full_name}.{message.nested_type[index].name}",
+        )
+
+    for index in range(oneof_count):
+        message.oneof_decl.add(name=f"choice_{index}")
+        for _ in range(4):
+            number += 1
+            message.field.add(name=f"choice_{number}", number=number, type=FieldDescriptorProto.TYPE_INT32, oneof_index=index)
+
+    for _ in range(field_count):
+        number += 1
+        message.field.add(name=f"field_{number}", number=number, type=FieldDescriptorProto.TYPE_UINT32)
+
+def wide_message_file(field_count):
+    file_proto = descriptor_pb2.FileDescriptorProto(name="wide.proto", package="bench", syntax="proto3")
+    message = file_proto.message_type.add(name="Wide")
+    add_fields(message, ".bench.Wide", field_count, field_count // 2, field_count // 20)
+    return file_proto
+
+def deep_message_file(depth, field_count):
+    file_proto = descriptor_pb2.FileDescriptorProto(name="deep.proto", package="bench", syntax="proto3")
+    message = file_proto.message_type.add(name="Level0")
+    full_name = ".bench.Level0"
+    for level in range(1, depth + 1):
+        add_fields(message, full_name, field_count, field_count // 4, 1)
+        message = message.nested_type.add(name=f"Level{level}")
+        full_name += f".Level{level}"
+    return file_proto
+
+def legacy_generate_proto_content(file_proto):
+    lines = []
+    for message in file_proto.message_type:
+        legacy_generate_message(message, lines, 0)
+    return lines
+
+def current_generate_messages(file_proto):
+    lines = []
+    for message in file_proto.message_type:
+        generate_message(message, lines, 0, f".{file_proto.package}")
+    return lines
+
+def bench_render(size):
+    print("render: proto text generation for wide and deeply nested messages")
+
+    cases = [
+        ("wide, 400 fields", wide_message_file(400)),
+        ("wide, 1600 fields", wide_message_file(1600)),
+        ("deep, 40 levels x 40 fields", deep_message_file(40, 40)),
+    ]
+    for name, file_proto in cases:
+        legacy = legacy_generate_proto_content(file_proto)
+        current = current_generate_messages(file_proto)
+        mismatched = sum(1 for old_line, new_line in zip(legacy, current) if old_line != new_line)
+
+        old_time = best_time(legacy_generate_proto_content, file_proto, repeat=3)
+        new_time = best_time(current_generate_messages, file_proto, repeat=3)
+        print(
+            f"  {name:<28} old {old_time * 1000:9.2f} ms  new {new_time * 1000:9.2f} ms  "
+            f"({old_time / new_time:5.1f}x, {mismatched} map lines fixed)"
+        )
+
+def descriptor_set(file_count):
+    file_set = descriptor_pb2.FileDescriptorSet()
+    for index in range(file_count):
+        file_proto = file_set.file.add()
+        file_proto.CopyFrom(wide_message_file(120))
+        file_proto.name = f"bench/file_{index}.proto"
+    return file_set.SerializeToString()
+
+def legacy_render_set(data):
+    # 旧流程: 解析整个集合后逐个 SerializeToString，再由 generate_proto_from_bytes 重新解析
+    file_set = descriptor_pb2.FileDescriptorSet.FromString(data)
+    return [generate_proto_from_bytes(file_proto.SerializeToString()) for file_proto in file_set.file]
+
+def current_render_set(data):
+    file_set = descriptor_pb2.FileDescriptorSet.FromString(data)
+    return [generate_proto_from_descriptor(file_proto) for file_proto in file_set.file]
+
+def bench_reparse(size):
+    print("reparse: rendering every file of a FileDescriptorSet")
+    data = descriptor_set(max(1, size // 4096))
+
+    if legacy_render_set(data) != current_render_set(data):
+        raise AssertionError("rendered output differs")
+
+    file_set = descriptor_pb2.FileDescriptorSet.FromString(data)
+    parse_time = best_time(descriptor_pb2.FileDescriptorSet.FromString, data)
+    reparse_time = best_time(
+        lambda: [descriptor_pb2.FileDescriptorProto.FromString(f.SerializeToString()) for f in file_set.file]
+    )
+    print(f"  {len(file_set.file)} files, {len(data)} bytes")
+    print(f"  {'set parse':<28} {parse_time * 1000:9.2f} ms")
+    print(f"  {'serialize + reparse (old)':<28} {reparse_time * 1000:9.2f} ms")
+    report("parse + render", len(data), best_time(legacy_render_set, data), best_time(current_render_set, data))
+
+def command_id_file(value_count):
+    file_proto = descriptor_pb2.FileDescriptorProto(name="cmd.proto", package="bench", syntax="proto3")
+    enum = file_proto.enum_type.add(name="CmdId")
+    for number in range(value_count):
+        enum.value.add(name=f"CMD_ID_{number:08d}_REQUEST_NOTIFY", number=number)
+    return file_proto
+
+def bench_stream(size):
+    print("stream: writing a proto with a very large enum")
+    file_proto = command_id_file(max(1, size // 2))
+    path = "benchmark_stream.proto"
+
+    def build_and_write():
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(generate_proto_content(file_proto))
+
+    def stream():
+        with open(path, "w", encoding="utf-8") as f:
+            write_proto_content(file_proto, f)
+
+    try:
+        build_and_write()
+        with open(path, encoding="utf-8") as f:
+            expected = f.read()
+        stream()
+        with open(path, encoding="utf-8") as f:
+            if f.read() != expected:
+                raise AssertionError("streamed output differs")
+
+        print(f"  {len(file_proto.enum_type[0].value)} enum values, {len(expected)} characters")
+        report("write", len(expected), best_time(build_and_write, repeat=3), best_time(stream, repeat=3))
+        old_peak = peak_memory(build_and_write)
+        new_peak = peak_memory(stream)
+        print(f"  {'':<28} peak memory old {old_peak / (1 << 20):7.1f} MB  new {new_peak / (1 << 20):7.1f} MB")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def bench_cache(size):
+    print("cache: rendering the same descriptors again with the render cache")
+    file_set = descriptor_pb2.FileDescriptorSet.FromString(descriptor_set(max(1, size // 4096)))
+    descriptors = [file_proto.SerializeToString() for file_proto in file_set.file]
+    directory = tempfile.mkdtemp(prefix="benchmark_cache_")
+
+    def render_each():
+        return [render_descriptors([descriptor_data], "csharp") for descriptor_data in descriptors]
+
+    try:
+        expected = render_each()
+        render_cache.enable(directory)
+        if render_each() != expected or render_each() != expected:
+            raise AssertionError("cached output differs")
+
+        print(f"  {len(descriptors)} files, {sum(map(len, descriptors))} bytes")
+        render_cache.disable()
+        old_time = best_time(render_each, repeat=3)
+        render_cache.enable(directory)
+        report("parse + render", sum(map(len, descriptors)), old_time, best_time(render_each, repeat=3))
+    finally:
+        render_cache.disable()
+        shutil.rmtree(directory, ignore_errors=True)
+
+def bench_pb_parallel(size):
+    jobs = os.cpu_count() or 1
+    print(f"pb-parallel: rendering a large .pb FileDescriptorSet with {jobs} worker processes")
+    data = descriptor_set(max(1, size // 1024))
+    directory = Path(tempfile.mkdtemp(prefix="benchmark_pb_"))
+    file_path = directory / "set.pb"
+
+    def serial():
+        with contextlib.redirect_stdout(None):
+            stream_pb_file(file_path, data, directory / "serial")
+
+    def parallel():
+        with contextlib.redirect_stdout(None):
+            stream_pb_file_parallel(file_path, data, directory / "parallel", jobs)
+
+    try:
+        serial()
+        parallel()
+        for output_file in (directory / "serial").rglob("*.proto"):
+            other = directory / "parallel" / output_file.relative_to(directory / "serial")
+            if output_file.read_bytes() != other.read_bytes():
+                raise AssertionError(f"parallel output differs: {other}")
+
+        print(f"  {len(descriptor_pb2.FileDescriptorSet.FromString(data).file)} files, {len(data)} bytes")
+        report("parse + render + write", len(data), best_time(serial, repeat=3), best_time(parallel, repeat=3))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def bench_index(size):
+    print("index: rendering one package out of a large .pb FileDescriptorSet")
+    file_set = descriptor_pb2.FileDescriptorSet()
+    for index in range(max(1, size // 1024)):
+        file_proto = file_set.file.add()
+        file_proto.CopyFrom(wide_message_file(120))
+        file_proto.name = f"bench/file_{index}.proto"
+        file_proto.package = f"bench.p{index % 64}"
+    data = file_set.SerializeToString()
+    file_path = Path("set.pb")
+    selection = FileSelection(["bench.p7"])
+
+    def render_all_then_filter():
+        selected = {file_proto.name for file_proto in file_set.file if file_proto.package == "bench.p7"}
+        return [item for item in render_pb_file(file_path, data) if item[0] in selected]
+
+    if render_all_then_filter() != render_pb_file(file_path, data, selection):
+        raise AssertionError("selected output differs")
+
+    print(f"  {len(file_set.file)} files, {len(data)} bytes, {len(render_pb_file(file_path, data, selection))} selected")
+    report(
+        "select + render", len(data),
+        best_time(render_all_then_filter, repeat=3), best_time(render_pb_file, file_path, data, selection, repeat=3),
+    )
+
+def bench_pb_stream(size):
+    print("pb-stream: rendering a large .pb with and without --low-memory")
+    directory = Path(tempfile.mkdtemp(prefix="benchmark_pb_stream_"))
+    file_path = directory / "set.pb"
+    # 在子进程里生成，避免主进程的内存占用被 fork 出的子进程继承进峰值 RSS
+    subprocess.run([
+        sys.executable, "-c",
+        f"import benchmark\nopen({str(file_path)!r}, 'wb').write(benchmark.descriptor_set({max(1, size // 256)}))",
+    ], check=True, cwd=os.path.dirname(__file__) or None)
+
+    whole = (
+        "from pathlib import Path\nfrom proto_writer import stream_pb_file\n"
+        f"stream_pb_file(Path({str(file_path)!r}), Path({str(file_path)!r}).read_bytes(), Path({str(directory / 'whole')!r}))"
+    )
+    mapped = (
+        "from pathlib import Path\nfrom proto_writer import stream_mapped_pb_file\n"
+        f"stream_mapped_pb_file(Path({str(file_path)!r}), Path({str(directory / 'mapped')!r}))"
+    )
+
+    try:
+        old_start = time.perf_counter()
+        old_peak = child_peak_rss(whole)
+        old_time = time.perf_counter() - old_start
+        new_start = time.perf_counter()
+        new_peak = child_peak_rss(mapped)
+        new_time = time.perf_counter() - new_start
+
+        for output_file in (directory / "whole").rglob("*.proto"):
+            other = directory / "mapped" / output_file.relative_to(directory / "whole")
+            if output_file.read_bytes() != other.read_bytes():
+                raise AssertionError(f"low-memory output differs: {other}")
+
+        print(f"  {file_path.stat().st_size} bytes")
+        report("process (incl. startup)", file_path.stat().st_size, old_time, new_time)
+        print(f"  {'':<28} peak RSS old {old_peak / (1 << 20):7.1f} MB  new {new_peak / (1 << 20):7.1f} MB")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def bench_backends(size):
+    print("backends: parsing and rendering a FileDescriptorSet on each google.protobuf backend")
+    script = (
+        "import sys\nfrom pathlib import Path\nimport benchmark, protobuf_backend\n"
+        "from google.protobuf import descriptor_pb2\nfrom proto_writer import render_pb_file\n"
+        f"data = benchmark.descriptor_set({max(1, size // 4096)})\n"
+        "parse = benchmark.best_time(descriptor_pb2.FileDescriptorSet.FromString, data, repeat=3)\n"
+        "render = benchmark.best_time(render_pb_file, Path('set.pb'), data, repeat=3)\n"
+        "print(protobuf_backend.backend(), len(data), parse, render)"
+    )
+
+    for name in ("upb", "cpp", "python"):
+        env = dict(os.environ, PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=name)
+        result = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, env=env, cwd=os.path.dirname(__file__) or None
+        )
+        if result.returncode != 0:
+            print(f"  {name:<28} not available")
+            continue
+
+        active, data_size, parse_time, render_time = result.stdout.split()[-4:]
+        parse_time, render_time = float(parse_time), float(render_time)
+        print(
+            f"  {name:<28} parse {parse_time * 1000:9.2f} ms  parse + render {render_time * 1000:9.2f} ms  "
+            f"({int(data_size) / render_time / (1 << 20):8.1f} MB/s, active: {active})"
+        )
+
+def bench_names(size):
+    print("names: proto filename detection for a descriptor without a name")
+    header = (
+        "// <auto-generated>\n//     Generated by the protocol buffer compiler.  DO NOT EDIT!\n// </auto-generated>\n"
+        "using pb = global::Google.Protobuf;\nnamespace Game {\n"
+        "  public static partial class SmallReflection {\n"
+    )
+    body = "  public sealed partial class Player : pb::IMessage<Player> { }\n" * max(1, size * 8 // 64)
+    source_code = (header + body).encode()
+
+    expected = legacy_get_csharp_proto_name(source_code)
+    if detect_proto_name(source_code, "csharp") != expected:
+        raise AssertionError("detected name differs")
+
+    print(f"  {len(source_code)} byte C# source")
+    report(
+        "detect", len(source_code),
+        best_time(legacy_get_csharp_proto_name, source_code), best_time(detect_proto_name, source_code, "csharp"),
+    )
+
+def bench_output(size):
+    print("output: rewriting an unchanged output tree")
+    contents = [
+        (f"pkg{index % 16}/file_{index}.proto", generate_proto_content(wide_message_file(120)))
+        for index in range(max(1, size // 2048))
+    ]
+    directory = Path(tempfile.mkdtemp(prefix="benchmark_output_"))
+
+    def legacy_write():
+        for name, content in contents:
+            output_file = directory / name
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(output_file, "w", encoding="utf-8") as f:
+                f.write(content)
+
+    def write():
+        writer = OutputWriter()
+        for name, content in contents:
+            writer.write_text(directory / name, content)
+
+    try:
+        legacy_write()
+        before = {path: path.stat().st_mtime_ns for path in directory.rglob("*.proto")}
+        write()
+        if any(path.stat().st_mtime_ns != mtime for path, mtime in before.items()):
+            raise AssertionError("unchanged files were rewritten")
+
+        total = sum(len(content) for _, content in contents)
+        print(f"  {len(contents)} files, {total} characters")
+        report("write unchanged", total, best_time(legacy_write, repeat=3), best_time(write, repeat=3))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+BENCHMARKS = {
+    "escape": bench_escape,
+    "python": bench_python,
+    "go": bench_go,
+    "go-const": bench_go_const,
+    "go-bytes": bench_go_bytes,
+    "cpp": bench_cpp,
+    "render": bench_render,
+    "reparse": bench_reparse,
+    "stream": bench_stream,
+    "cache": bench_cache,
+    "pb-parallel": bench_pb_parallel,
+    "index": bench_index,
+    "pb-stream": bench_pb_stream,
+    "backends": bench_backends,
+    "names": bench_names,
+    "output": bench_output,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ProtoExtractor benchmarks")
+    parser.add_argument("names", nargs="*", choices=[[]] + list(BENCHMARKS), default=[])
+    parser.add_argument("--size", type=int, default=512 * 1024, help="Synthetic descriptor size in bytes.")
+    args = parser.parse_args()
+
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name](args.size)
+        print()
@@ -1,432 +1,527 @@
 import re
 import binascii
 import base64
+from itertools import repeat
+from tracing import span
+from strategies import StrategySet
+from source_scanner import (
+    at,
+    locate_all,
+    preceded_by,
+    expect,
+    scan_string,
+    scan_string_sequence,
+    scan_verbatim_string,
+    scan_initializer,
+)
+from literal_decoder import (
+    decode_c_literal,
+    decode_c_literals,
+    decode_python_literal,
+    decode_go_literals,
+    decode_cpp_char_array,
+    decode_cpp_string_literals,
+)
 
 def extract_descriptor_data(source_code, source_language):
+    # 返回源码中所有内嵌描述符的列表 (按出现顺序去重)，一个都没有时返回 None。
+    # source_code 可以是 bytes、只读 mmap 或 str，定位始终按字节进行
+    if isinstance(source_code, str):
+        source_code = source_code.encode("utf-8")
+
     if source_language == 'csharp':
-        return extract_from_csharp(source_code)
+        descriptors = extract_from_csharp(source_code)
     elif source_language == 'java':
-        return extract_from_java(source_code)
+        descriptors = extract_from_java(source_code)
     elif source_language == 'go':
-        return extract_from_go(source_code)
+        descriptors = extract_from_go(source_code)
     elif source_language == 'python':
-        return extract_from_python(source_code)
+        descriptors = extract_from_python(source_code)
     elif source_language == 'ruby':
-        return extract_from_ruby(source_code)
+        descriptors = extract_from_ruby(source_code)
     elif source_language == 'php':
-        return extract_from_php(source_code)
+        descriptors = extract_from_php(source_code)
     elif source_language == 'cpp':
-        return extract_from_cpp(source_code)
+        descriptors = extract_from_cpp(source_code)
     else:
         raise ValueError(f"Unsupported source language: {source_language}")
 
-def extract_from_csharp(csharp_code):
-    # descriptorData = global::System.Convert.FromBase64String(string.Concat(...));
-    pattern = re.compile(
-        r'descriptorData\s*=\s*global::System\.Convert\.FromBase64String\s*\(\s*string\.Concat\s*\(([\s\S]*?)\)\s*\);',
-        re.DOTALL
-    )
-
-    match = pattern.search(csharp_code)
-    if not match:
-        # byte[] descriptorData = global::System.Convert.FromBase64String(@"...");
-        pattern = re.compile(
-            r'byte\[]\s+descriptorData\s*=\s*global::System\.Convert\.FromBase64String\s*\(\s*@?"([^"]+)"\s*\);',
-            re.DOTALL
-        )
-        match = pattern.search(csharp_code)
-        if match:
-            base64_str = match.group(1)
-            return base64.b64decode(base64_str)
-        else:
-            print("DescriptorData assignment not found in C# code")
+    if not descriptors:
+        return None
+
+    # 合并构建的源码可能把同一个描述符包含多次，只保留第一次
+    return list(dict.fromkeys(descriptors))
+
+# 每种语言先用 find 找一个便宜的锚点，再从锚点向后做有界扫描，见 source_scanner
+CSHARP_ANCHOR = b"descriptorData"
+JAVA_ANCHOR = b"descriptorData"
+GO_ANCHOR = b"_proto_rawDesc"
+PYTHON_ANCHOR = b"DESCRIPTOR"
+RUBY_ANCHOR = b"descriptor_data"
+PHP_ANCHOR = b"internalAddGeneratedFile"
+CPP_ANCHOR = b"descriptor_table_protodef_"
+
+_CSHARP_ASSIGNMENT = re.compile(rb'descriptorData\s*=\s*global::System\.Convert\.FromBase64String\s*\(\s*')
+_CSHARP_CONCAT = re.compile(rb'string\.Concat\s*\(')
+_JAVA_DECLARATION = re.compile(rb'String\s*\[\]\s*$')
+_JAVA_ASSIGNMENT = re.compile(rb'descriptorData\s*=\s*\{')
+_GO_DECLARATION = re.compile(rb'\b(?:const|var)\s+file_\w*$')
+_GO_ASSIGNMENT = re.compile(rb'_proto_rawDesc\s*=\s*')
+_GO_BYTE_SLICE = re.compile(rb'(?:string\s*\(\s*)?\[\]byte\s*\{')
+# 去掉空白后的 []byte 元素列表: 0x 加一到两位十六进制，或不超过三位的十进制
+_GO_BYTE = rb'(?:0x[0-9a-fA-F]{1,2}|[0-9]{1,3})'
+_GO_BYTE_LIST = re.compile(rb'(?:' + _GO_BYTE + rb',)*+' + _GO_BYTE)
+_PYTHON_POOL_CALL = re.compile(rb'DESCRIPTOR\s*=\s*_descriptor_pool\.Default\(\)\.AddSerializedFile\(\s*')
+_PYTHON_FILE_DESCRIPTOR = re.compile(rb'DESCRIPTOR\s*=\s*_descriptor\.FileDescriptor\(\s*')
+# 老版本 _descriptor.FileDescriptor(name=..., serialized_options=b'...', serialized_pb=b'...') 的参数，
+# 逐个词法单元跳过直到 serialized_pb=，见 _python_serialized_pb
+_PYTHON_ARGUMENT_TOKEN = re.compile(
+    rb'(?P<argument>serialized_pb\s*=\s*)|(?P<open>[(\[{])|(?P<close>[)\]}])'
+    rb'|\s++|\w++|[.,=:]|\'(?:[^\'\\]|\\.)*+\'|"(?:[^"\\]|\\.)*+"',
+    re.DOTALL
+)
+_PYTHON_LEGACY_CALL = re.compile(rb'_b\(\s*')
+# 一个或多个相邻的 (bytes) 字符串字面量
+_PYTHON_LITERALS = re.compile(
+    rb'(?:[bB]?(?:\'(?:[^\'\\]|\\.)*+\'|"(?:[^"\\]|\\.)*+")\s*+)++',
+    re.DOTALL
+)
+_RUBY_ASSIGNMENT = re.compile(rb'descriptor_data\s*=\s*')
+_PHP_DECLARATION = re.compile(rb'\$pool->$')
+_PHP_CALL = re.compile(rb'internalAddGeneratedFile\s*\(\s*')
+_PHP_CALL_END = re.compile(rb'\s*,\s*true\s*\)')
+_CPP_DECLARATION = re.compile(rb'\bconst\s+char\s+$')
+_CPP_SECTION_DEFINITION = re.compile(
+    rb'descriptor_table_protodef_\w+\s*\[\]\s*\w+\s*\(\s*protodesc_cold\s*\)\s*=\s*\{'
+)
+_CPP_PLAIN_DEFINITION = re.compile(rb'descriptor_table_protodef_\w+\s*\[\]\s*=\s*\{')
+
+def _csharp_concat(code, pos):
+    concat = _CSHARP_CONCAT.match(code, pos)
+    if concat is None:
+        return None
+
+    fragments, end = scan_string_sequence(code, concat.end(), b",")
+    end = expect(code, end, b")")
+    if end == -1:
+        return None
+    return _csharp_call_end(code, end, fragments)
+
+def _csharp_verbatim(code, pos):
+    fragment, end = scan_verbatim_string(code, pos)
+    if fragment is None:
+        return None
+    return _csharp_call_end(code, end, [fragment])
+
+def _csharp_literal(code, pos):
+    fragment, end = scan_string(code, pos)
+    if fragment is None:
+        return None
+    return _csharp_call_end(code, end, [fragment])
+
+def _csharp_call_end(code, pos, fragments):
+    # FromBase64String(...) 的右括号，确认字面量已经完整
+    end = expect(code, pos, b")")
+    if end == -1:
+        return None
+    return fragments, end
+
+_CSHARP_VALUE = StrategySet("csharp", [
+    ("string.Concat", _csharp_concat),
+    ("verbatim", _csharp_verbatim),
+    ("literal", _csharp_literal),
+])
+
+def _scan_csharp(code, pos, record=True):
+    # descriptorData = global::System.Convert.FromBase64String(string.Concat("...", "..."));
+    # byte[] descriptorData = global::System.Convert.FromBase64String(@"...");
+    match = _CSHARP_ASSIGNMENT.match(code, pos)
+    if match is None:
+        return None, pos
+
+    located = (_CSHARP_VALUE if record else _CSHARP_VALUE.peek)(code, match.end())
+    if located is None:
+        return None, match.end()
+    return located
+
+def _scan_java(code, pos):
+    # static { java.lang.String[] descriptorData = { "..." + "...", "..." }; }
+    match = _JAVA_ASSIGNMENT.match(code, pos)
+    if match is None or not preceded_by(code, pos, _JAVA_DECLARATION):
+        return None, pos
+
+    fragments, end = scan_string_sequence(code, match.end(), b"+,")
+    close = expect(code, end, b"}")
+    if close == -1:
+        return None, end
+    return fragments, close
+
+def _go_string(code, pos):
+    # const file_xxx_proto_rawDesc = "..." + "..."
+    if not at(code, pos, b'"'):
+        return None
+    fragments, end = scan_string_sequence(code, pos, b"+")
+    return ("string", fragments), end
+
+def _go_byte_slice(code, pos):
+    # var file_xxx_proto_rawDesc = []byte{...}
+    # var file_xxx_proto_rawDesc = string([]byte{...})
+    byte_slice = _GO_BYTE_SLICE.match(code, pos)
+    if byte_slice is None:
+        return None
+
+    close = code.find(b"}", byte_slice.end())
+    if close == -1:
+        return None
+    return ("bytes", code[byte_slice.end():close]), close + 1
+
+_GO_VALUE = StrategySet("go", [
+    ("const string", _go_string),
+    ("[]byte", _go_byte_slice),
+])
+
+def _scan_go(code, pos):
+    match = _GO_ASSIGNMENT.match(code, pos)
+    if match is None or not preceded_by(code, pos, _GO_DECLARATION):
+        return None, pos
+
+    located = _GO_VALUE(code, match.end())
+    if located is None:
+        return None, match.end()
+    return located
+
+def _python_literals(code, pos, closed):
+    legacy_call = _PYTHON_LEGACY_CALL.match(code, pos)
+    if legacy_call is not None:
+        pos = legacy_call.end()
+
+    literals = _PYTHON_LITERALS.match(code, pos)
+    if literals is None:
+        return None
+
+    end = literals.end()
+    if closed or legacy_call is not None:
+        end = expect(code, end, b")")
+        if end == -1:
             return None
+    return literals.group().rstrip(), end
 
-    concat_arguments = match.group(1)
+def _python_pool(code, pos):
+    # DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'...')  (3.20 以后，配合 _builder)
+    match = _PYTHON_POOL_CALL.match(code, pos)
+    if match is None:
+        return None
+    return _python_literals(code, match.end(), True)
 
-    string_matches = re.findall(r'"([^"]*)"', concat_arguments)
-    if not string_matches:
-        print("No string fragments found in string.Concat")
+def _python_file_descriptor(code, pos):
+    # DESCRIPTOR = _descriptor.FileDescriptor(..., serialized_pb=b'...')  (更早的版本)
+    match = _PYTHON_FILE_DESCRIPTOR.match(code, pos)
+    if match is None:
         return None
 
-    full_base64 = ''.join(string_matches)
+    pos = _python_serialized_pb(code, match.end())
+    if pos == -1:
+        return None
+    return _python_literals(code, pos, False)
+
+def _python_serialized_pb(code, pos):
+    # 返回调用本层 serialized_pb= 之后的位置; 到达调用的右括号或无法识别的字符时返回 -1，
+    # 不会越过这个调用扫描后面的代码
+    depth = 0
+    while True:
+        token = _PYTHON_ARGUMENT_TOKEN.match(code, pos)
+        if token is None:
+            return -1
+        pos = token.end()
+
+        kind = token.lastgroup
+        if kind == "argument" and depth == 0:
+            return pos
+        if kind == "open":
+            depth += 1
+        elif kind == "close":
+            if depth == 0:
+                return -1
+            depth -= 1
+
+_PYTHON_DESCRIPTOR = StrategySet("python", [
+    ("AddSerializedFile", _python_pool),
+    ("FileDescriptor", _python_file_descriptor),
+])
+
+def _scan_python(code, pos):
+    located = _PYTHON_DESCRIPTOR(code, pos)
+    if located is None:
+        return None, pos
+    return located
+
+def _ruby_literal(code, pos):
+    # descriptor_data = "..."
+    literal, end = scan_string(code, pos)
+    if literal is None:
+        return None
+    return literal, end
+
+def _ruby_same_line(code, pos):
+    # descriptor_data = xxx("...")，取同一行内的第一个字符串
+    line_end = code.find(b"\n", pos)
+    quote = code.find(b'"', pos, len(code) if line_end == -1 else line_end)
+    if quote == -1:
+        return None
+    return _ruby_literal(code, quote)
+
+_RUBY_VALUE = StrategySet("ruby", [
+    ("literal", _ruby_literal),
+    ("same line", _ruby_same_line),
+])
+
+def _scan_ruby(code, pos):
+    match = _RUBY_ASSIGNMENT.match(code, pos)
+    if match is None:
+        return None, pos
+
+    located = _RUBY_VALUE(code, match.end())
+    if located is None:
+        return None, match.end()
+    return located
+
+def _scan_php(code, pos):
+    # $pool->internalAddGeneratedFile("...", true);
+    match = _PHP_CALL.match(code, pos)
+    if match is None or not preceded_by(code, pos, _PHP_DECLARATION):
+        return None, pos
+
+    literal, end = scan_string(code, match.end())
+    if literal is None:
+        return None, match.end()
+
+    call_end = _PHP_CALL_END.match(code, end)
+    if call_end is None:
+        return None, end
+    return literal, call_end.end()
+
+def _cpp_definition(regex):
+    def scan(code, pos):
+        match = regex.match(code, pos)
+        if match is None:
+            return None
+
+        body, end = scan_initializer(code, match.end())
+        if body is None:
+            return None
+        return body, end
+    return scan
+
+_CPP_DEFINITION = StrategySet("cpp", [
+    ("section attribute", _cpp_definition(_CPP_SECTION_DEFINITION)),
+    ("plain", _cpp_definition(_CPP_PLAIN_DEFINITION)),
+])
+
+def _scan_cpp(code, pos):
+    # const char descriptor_table_protodef_xxx[] ABSL_ATTRIBUTE_SECTION_VARIABLE(protodesc_cold) = { ... };
+    # const char descriptor_table_protodef_xxx[] = { ... };
+    if not preceded_by(code, pos, _CPP_DECLARATION):
+        return None, pos
+
+    located = _CPP_DEFINITION(code, pos)
+    if located is None:
+        return None, pos
+    return located
+
+# --first-descriptor-only 时读到第一个描述符结束就停止读取的语言，见 source_reader
+def _probe_csharp(code, pos):
+    return _scan_csharp(code, pos, record=False)
+
+PREFIX_LOCATORS = {
+    "csharp": (CSHARP_ANCHOR, _probe_csharp),
+    "java": (JAVA_ANCHOR, _scan_java),
+}
+
+def extract_from_csharp(csharp_code):
+    with span("locate"):
+        located = list(locate_all(csharp_code, CSHARP_ANCHOR, _scan_csharp))
 
-    try:
-        return base64.b64decode(full_base64)
-    except binascii.Error as e:
-        print(f"Error decoding Base64 string: {str(e)}")
+    if not located:
+        print("DescriptorData assignment not found in C# code")
         return None
 
+    descriptors = []
+    for fragments in located:
+        if not fragments:
+            print("No string fragments found in string.Concat")
+            continue
+
+        full_base64 = b''.join(fragments)
+
+        try:
+            with span("decode"):
+                descriptors.append(base64.b64decode(full_base64))
+        except binascii.Error as e:
+            print(f"Error decoding Base64 string: {str(e)}")
+
+    return descriptors
+
 def extract_from_java(java_code):
-    array_pattern = re.compile(
-        r"static\s*\{\s*"
-        r"java\.lang\.String\[]\s+descriptorData\s*=\s*\{\s*"
-        r"([\s\S]*?)\s*}\s*;",
-        re.DOTALL
-    )
-
-    array_match = array_pattern.search(java_code)
-    if not array_match:
+    with span("locate"):
+        located = list(locate_all(java_code, JAVA_ANCHOR, _scan_java))
+
+    if not located:
         print("DescriptorData array not found in static block")
         return None
 
-    array_content = array_match.group(1)
-    full_string = ""
-
-    string_pattern = re.compile(r'"((?:\\.|[^"\\])*)"')
-    for match in string_pattern.finditer(array_content):
-        escaped_string = match.group(1)
-        full_string += escaped_string
-
-    raw_bytes = process_escape_sequences(full_string).encode("latin-1")
-    return raw_bytes
-
-def extract_from_go(go_code: str) -> bytes | None:
-    # 新版本
-    # const file_testDataC_proto_rawDesc = "..." + "..."
-    const_match = re.search(r'const\s+file_\w+_proto_rawDesc\s*=', go_code)
-    if const_match:
-        start_idx = const_match.end()
-        remaining_code = go_code[start_idx:]
-
-        # 匹配连续的字符串字面量，允许中间有 +、空格、换行
-        string_parts = re.findall(r'"((?:\\.|[^"\\])*)"', remaining_code)
-        if string_parts:
-            full_escaped = ''.join(string_parts)
+    with span("decode"):
+        return [decode_c_literals(fragments, "java") for fragments in located]
+
+def extract_from_go(go_code) -> list[bytes] | None:
+    with span("locate"):
+        located = list(locate_all(go_code, GO_ANCHOR, _scan_go))
+
+    if not located:
+        print("Raw descriptor not found in Go code")
+        return None
+
+    descriptors = []
+    for kind, value in located:
+        if kind == "string":
             try:
                 # cnmd go lang, cnmd protobuf-go
-                return process_go_escape_sequences(full_escaped)
+                with span("decode"):
+                    descriptors.append(decode_go_literals(value))
             except ValueError as e:
                 print(f"Error decoding Go escape sequences: {e}")
-                return None
+            continue
 
-    # 旧版本
-    # var file_filename_proto_rawDesc = []byte{...}
-    # var file_filename_proto_rawDesc = string([]byte{...})
-    pattern = re.compile(
-        r'var\s+file_\w+_proto_rawDesc\s*=\s*(?:string\s*\()?\s*\[\]byte\s*\{([\s\S]+?)\}(?:\s*\))?',
-        re.DOTALL
-    )
-    match = pattern.search(go_code)
-    if match:
-        byte_array_content = match.group(1)
         try:
-            return parse_go_byte_array(byte_array_content)
+            with span("decode"):
+                raw_bytes = parse_go_byte_array(value)
         except ValueError as e:
             print(f"Error parsing Go byte array: {e}")
-            return None
+            continue
 
-    print("Raw descriptor not found in Go code")
-    return None
+        # 非法的元素已经在 parse_go_byte_array 里报告过
+        if raw_bytes is not None:
+            descriptors.append(raw_bytes)
+
+    return descriptors
 
 def extract_from_python(python_code):
-    # DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'...')
-    pattern = re.compile(
-        r'DESCRIPTOR\s*=\s*_descriptor_pool\.Default\(\)\.AddSerializedFile\(b([\'"])(.*?)\1\)',
-        re.DOTALL
-    )
-
-    match = pattern.search(python_code)
-    if not match:
-        # DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile('...')
-        pattern = re.compile(
-            r'DESCRIPTOR\s*=\s*_descriptor_pool\.Default\(\)\.AddSerializedFile\(([\'"])(.*?)\1\)',
-            re.DOTALL
-        )
-        match = pattern.search(python_code)
-        if not match:
-            print("DESCRIPTOR assignment with AddSerializedFile not found")
-            return None
+    with span("locate"):
+        located = list(locate_all(python_code, PYTHON_ANCHOR, _scan_python))
 
-    byte_str = match.group(2)
+    if not located:
+        print("DESCRIPTOR assignment with AddSerializedFile not found")
+        return None
+
+    descriptors = []
+    for literal in located:
+        try:
+            with span("decode"):
+                descriptors.append(decode_python_literal(literal))
+        except (SyntaxError, ValueError) as e:
+            print(f"Error evaluating Python bytes literal: {e}")
 
-    processed_bytes = process_escape_sequences(byte_str).encode("latin-1")
-    return processed_bytes
+    return descriptors
 
 def extract_from_ruby(ruby_code):
-    # descriptor_data = "..."
-    pattern = re.compile(
-        r'descriptor_data\s*=\s*"((?:\\"|[^"])*)"',
-        re.DOTALL
-    )
-
-    match = pattern.search(ruby_code)
-    if match:
-        escaped_string = match.group(1)
-        processed_bytes = process_escape_sequences(escaped_string).encode("latin-1")
-        return processed_bytes
-
-    # pool.add_serialized_file(descriptor_data)
-    pool_match = re.search(
-        r'pool\.add_serialized_file\(descriptor_data\)',
-        ruby_code
-    )
-    if pool_match:
-        assignment_pattern = re.compile(
-            r'(descriptor_data\s*=\s*[\s\S]+?)\n\s*pool\.add_serialized_file',
-            re.DOTALL
-        )
-        assignment_match = assignment_pattern.search(ruby_code)
-        if assignment_match:
-            assignment_line = assignment_match.group(1)
-            string_match = re.search(r'"((?:\\"|[^"])*)"', assignment_line)
-            if string_match:
-                escaped_string = string_match.group(1)
-                return process_escape_sequences(escaped_string).encode("latin-1")
-
-    print("descriptor_data assignment not found in Ruby code")
-    return None
+    with span("locate"):
+        located = list(locate_all(ruby_code, RUBY_ANCHOR, _scan_ruby))
+
+    if not located:
+        print("descriptor_data assignment not found in Ruby code")
+        return None
+
+    with span("decode"):
+        return [decode_c_literal(escaped_string, "ruby") for escaped_string in located]
 
 def extract_from_php(php_code):
-    # $pool->internalAddGeneratedFile(...)
-    pattern = re.compile(
-        r'\$pool->internalAddGeneratedFile\s*\(\s*"((?:\\"|[^"])*)"\s*,\s*true\s*\)',
-        re.DOTALL
-    )
-
-    match = pattern.search(php_code)
-    if not match:
+    with span("locate"):
+        located = list(locate_all(php_code, PHP_ANCHOR, _scan_php))
+
+    if not located:
         print("internalAddGeneratedFile call not found in PHP code")
         return None
 
-    escaped_string = match.group(1)
-    processed_bytes = process_escape_sequences(escaped_string).encode("latin-1")
-    return processed_bytes
+    with span("decode"):
+        return [decode_c_literal(escaped_string, "php") for escaped_string in located]
 
 def extract_from_cpp(cpp_code):
-    pattern = re.compile(
-        r'const\s+char\s+descriptor_table_protodef_\w+\[]\s*ABSL_ATTRIBUTE_SECTION_VARIABLE\(\s*protodesc_cold\s*\)\s*=\s*{\s*([\s\S]+?)\s*}\s*;',
-        re.DOTALL
-    )
-
-    match = pattern.search(cpp_code)
-    if not match:
-        pattern = re.compile(
-            r'const\s+char\s+descriptor_table_protodef_\w+\[]\s*=\s*{\s*([\s\S]+?)\s*}\s*;',
-            re.DOTALL
-        )
-        match = pattern.search(cpp_code)
-        if not match:
-            print("Descriptor table not found in C++ code")
-            return None
+    with span("locate"):
+        located = list(locate_all(cpp_code, CPP_ANCHOR, _scan_cpp))
 
-    array_content = match.group(1)
-    full_bytes = bytearray()
-
-    char_pattern = re.compile(
-        r"'("
-        r"(?:"
-        r"\\['\"\\?abfnrtv]|"
-        r"\\[0-7]{1,3}|"
-        r"\\x[0-9a-fA-F]{2}|"
-        r"\\u[0-9a-fA-F]{4}|"
-        r"\\U[0-9a-fA-F]{8}|"
-        r"\\\\|"
-        r"."
-        r")"
-        r")\s*?'",
-        re.DOTALL
-    )
-
-    char_matches = char_pattern.findall(array_content)
-
-    if char_matches:
-        for char_match in char_matches:
-            processed_char = process_escape_sequences(char_match, supports_unicode=False)
-
-            if not processed_char:
-                print(f"Warning: Failed to process escape sequence: {char_match}")
-                continue
-
-            if len(processed_char) != 1:
-                print(f"Warning: Processed character should be single byte but got: {processed_char}")
-
-            for char in processed_char:
-                char_code = ord(char)
-                if char_code < 256:
-                    full_bytes.append(char_code)
-                else:
-                    print(f"Warning: Character code out of byte range: {char_code}")
-                    full_bytes.append(char_code & 0xFF)
-
-    if full_bytes:
-        return bytes(full_bytes)
-
-    full_string = ""
-    string_pattern = re.compile(r'"((?:\\"|[^"])*)"', re.DOTALL)
-    for match in string_pattern.finditer(array_content):
-        escaped_string = match.group(1)
-        full_string += escaped_string
-
-    if full_string:
-        processed_string = process_escape_sequences(full_string)
-        raw_bytes = processed_string.encode("latin-1")
-        return raw_bytes
-
-    print("No valid descriptor data found in C++ code")
-    return None
-
-def process_go_escape_sequences(s: str) -> bytes:
-    out = bytearray()
-    i = 0
-    n = len(s)
-
-    while i < n:
-        c = s[i]
-
-        # 普通字符，UTF-8 编码
-        if c != '\\':
-            out.extend(c.encode('utf-8'))
-            i += 1
-            continue
-
-        # 处理转义
-        i += 1
-        if i >= n:
-            raise ValueError("Incomplete escape sequence")
-
-        esc = s[i]
-        i += 1
-
-        if esc == 'a':
-            out.append(0x07)
-        elif esc == 'b':
-            out.append(0x08)
-        elif esc == 'f':
-            out.append(0x0C)
-        elif esc == 'n':
-            out.append(0x0A)
-        elif esc == 'r':
-            out.append(0x0D)
-        elif esc == 't':
-            out.append(0x09)
-        elif esc == 'v':
-            out.append(0x0B)
-        elif esc == '\\':
-            out.append(0x5C)
-        elif esc == '"':
-            out.append(0x22)
-        elif esc == "'":
-            out.append(0x27)
-
-        # 八进制 \NNN（最多 3 位）
-        elif esc in '01234567':
-            digits = esc
-            for _ in range(2):
-                if i < n and s[i] in '01234567':
-                    digits += s[i]
-                    i += 1
-                else:
-                    break
-            val = int(digits, 8)
-            if val > 255:
-                raise ValueError("Octal escape out of range")
-            out.append(val)
-
-        # 十六进制 \xNN（单字节）
-        elif esc == 'x':
-            if i + 1 >= n:
-                raise ValueError("Incomplete \\x escape")
-            hex_digits = s[i:i+2]
-            out.append(int(hex_digits, 16))
-            i += 2
-
-        # Unicode \uXXXX
-        elif esc == 'u':
-            hex_digits = s[i:i+4]
-            codepoint = int(hex_digits, 16)
-            out.extend(chr(codepoint).encode('utf-8'))
-            i += 4
-
-        # Unicode \UNNNNNNNN
-        elif esc == 'U':
-            hex_digits = s[i:i+8]
-            codepoint = int(hex_digits, 16)
-            if codepoint > 0x10FFFF:
-                raise ValueError("Unicode out of range")
-            out.extend(chr(codepoint).encode('utf-8'))
-            i += 8
+    if not located:
+        print("Descriptor table not found in C++ code")
+        return None
 
+    descriptors = []
+    for array_content in located:
+        raw_bytes = _decode_cpp_array(array_content.strip())
+        if raw_bytes:
+            descriptors.append(raw_bytes)
         else:
-            raise ValueError(f"Unknown escape sequence: \\{esc}")
-
-    return bytes(out)
-
-def process_escape_sequences(escaped_string, supports_unicode=True):
-    if supports_unicode:
-        def replace_unicode(match):
-            hex_str = match.group(1)
-            if len(hex_str) % 2 != 0:
-                hex_str = '0' + hex_str
-
-            return bytes.fromhex(hex_str).decode('latin-1')
-
-        escaped_string = re.sub(
-            r"\\u([0-9a-fA-F]{4})",
-            replace_unicode,
-            escaped_string
-        )
-
-        escaped_string = re.sub(
-            r"\\U([0-9a-fA-F]{8})",
-            replace_unicode,
-            escaped_string
-        )
-
-        if '\\x{' in escaped_string:
-            escaped_string = re.sub(
-                r"\\x\{([0-9a-fA-F]{2,6})\}",
-                replace_unicode,
-                escaped_string
-            )
-
-    def replace_octal(match):
-        octal_str = match.group(1)
-        char_code = int(octal_str, 8)
-        return chr(char_code) if char_code < 256 else f"\\{octal_str}"
-
-    escaped_string = re.sub(
-        r"\\([0-7]{1,3})",
-        replace_octal,
-        escaped_string
-    )
-
-    def replace_hex(match):
-        hex_str = match.group(1)
-        char_code = int(hex_str, 16)
-        return chr(char_code)
-
-    escaped_string = re.sub(
-        r"\\x([0-9a-fA-F]{2})",
-        replace_hex,
-        escaped_string
-    )
-
-    simple_escapes = {
-        "\\a": "\a",
-        "\\b": "\b",
-        "\\f": "\f",
-        "\\n": "\n",
-        "\\r": "\r",
-        "\\t": "\t",
-        "\\\"": "\"",
-        "\\'": "'",
-        "\\\\": "\\",
-        "\\v": "\v",
-        "\\0": "\0",
-        '\\$': '$',
-        '\\{': '{',
-        '\\}': '}',
-        "\\e": "\x1b",
-        "\\?": "?",
-    }
-
-    for esc, replacement in simple_escapes.items():
-        escaped_string = escaped_string.replace(esc, replacement)
-
-    return escaped_string
+            print("No valid descriptor data found in C++ code")
+
+    return descriptors
+
+def _cpp_char_array(array_content):
+    # { 'a', '\n', '\021', ... }
+    if not array_content.startswith(b"'"):
+        return None
+    return decode_cpp_char_array(array_content) or None
+
+def _cpp_string_literals(array_content):
+    # { "..." "..." }
+    if not array_content.startswith(b'"'):
+        return None
+    return decode_cpp_string_literals(array_content) or None
+
+_CPP_ARRAY = StrategySet("cpp array", [
+    ("char array", _cpp_char_array),
+    ("string literals", _cpp_string_literals),
+])
+
+def _decode_cpp_array(array_content):
+    with span("decode"):
+        return _CPP_ARRAY(array_content)
 
 def parse_go_byte_array(byte_array):
+    if isinstance(byte_array, str):
+        try:
+            byte_array = byte_array.encode("ascii")
+        except UnicodeEncodeError:
+            return _parse_go_byte_tokens(byte_array)
+
+    # 去掉所有空白: b"0x0a,0x10,...,0xff"
+    compact = byte_array.translate(None, b" \t\r\n").rstrip(b",")
+
+    if not compact:
+        return b""
+
+    # protoc-gen-go 总是输出 0x%02x，每项正好 5 个字符，用切片取出十六进制位后整段 unhexlify
+    count = compact.count(b",") + 1
+    if len(compact) == count * 5 - 1:
+        padded = compact + b","
+        if padded[0::5] == b"0" * count and padded[1::5] == b"x" * count and padded[4::5] == b"," * count:
+            hex_digits = bytearray(count * 2)
+            hex_digits[0::2] = padded[2::5]
+            hex_digits[1::2] = padded[3::5]
+            try:
+                return binascii.unhexlify(hex_digits)
+            except binascii.Error:
+                pass
+
+    # 十进制、不定宽十六进制混排; int(..., 0) 同时识别 0x 前缀。
+    # 先按 _parse_go_byte_tokens 接受的写法整体校验，0b101、0o7、0X0A、1_0 这类写法仍由它逐项报错
+    if _GO_BYTE_LIST.fullmatch(compact) is not None:
+        try:
+            return bytes(map(int, compact.split(b","), repeat(0, count)))
+        except ValueError:
+            pass
+
+    return _parse_go_byte_tokens(byte_array)
+
+def _parse_go_byte_tokens(byte_array):
+    if isinstance(byte_array, bytes):
+        byte_array = byte_array.decode("ascii", errors="replace")
     byte_array = byte_array.replace('\n', '')
     byte_array = byte_array.replace(' ', '')
     byte_array = byte_array.strip()
@@ -0,0 +1,176 @@
+from fnmatch import fnmatchcase
+from tracing import span
+from google.protobuf.descriptor_pb2 import FileDescriptorProto
+
+# 不解析成 Python 对象，直接按 wire format 扫描 FileDescriptorSet，
+# 记下每个 file 条目的偏移、长度、name、package 和 dependency。
+# 只需要集合里一部分文件时，按索引挑出条目，只解析和渲染这些条目。
+
+# FileDescriptorSet.file
+_SET_FILE = 1
+
+# FileDescriptorProto.name / package / dependency
+_FILE_NAME = 1
+_FILE_PACKAGE = 2
+_FILE_DEPENDENCY = 3
+
+_WIRE_VARINT = 0
+_WIRE_FIXED64 = 1
+_WIRE_LENGTH_DELIMITED = 2
+_WIRE_FIXED32 = 5
+
+class FileEntry:
+    __slots__ = ("offset", "length", "name", "package", "dependency")
+
+    def __init__(self, offset, length, name, package, dependency):
+        self.offset = offset
+        self.length = length
+        self.name = name
+        self.package = package
+        self.dependency = dependency
+
+def _read_varint(data, pos, end):
+    result = 0
+    shift = 0
+    while pos < end and shift < 64:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+    raise ValueError("Truncated or invalid varint")
+
+def _length_delimited_fields(data, pos, end):
+    # 逐个返回 (字段号, 内容起点, 内容终点)，其它类型的字段直接跳过
+    while pos < end:
+        tag, pos = _read_varint(data, pos, end)
+        field_number = tag >> 3
+        wire_type = tag & 0x7
+
+        if wire_type == _WIRE_LENGTH_DELIMITED:
+            length, pos = _read_varint(data, pos, end)
+            if pos + length > end:
+                raise ValueError("Truncated length-delimited field")
+            yield field_number, pos, pos + length
+            pos += length
+        elif wire_type == _WIRE_VARINT:
+            _, pos = _read_varint(data, pos, end)
+        elif wire_type == _WIRE_FIXED64:
+            pos += 8
+        elif wire_type == _WIRE_FIXED32:
+            pos += 4
+        else:
+            # 描述符里不会出现 group
+            raise ValueError(f"Unexpected wire type {wire_type}")
+
+    if pos != end:
+        raise ValueError("Truncated field")
+
+def _index_file(data, start, end):
+    name = ""
+    package = ""
+    dependency = []
+    for field_number, field_start, field_end in _length_delimited_fields(data, start, end):
+        if field_number == _FILE_NAME:
+            name = data[field_start:field_end].decode("utf-8")
+        elif field_number == _FILE_PACKAGE:
+            package = data[field_start:field_end].decode("utf-8")
+        elif field_number == _FILE_DEPENDENCY:
+            dependency.append(data[field_start:field_end].decode("utf-8"))
+    return FileEntry(start, end - start, name, package, dependency)
+
+def index_file(data):
+    # data 是单个 FileDescriptorProto
+    return _index_file(data, 0, len(data))
+
+def index_file_set(data):
+    # data 是 bytes 或 mmap; 不是合法的 FileDescriptorSet 时抛出 ValueError
+    with span("index"):
+        return [
+            _index_file(data, start, end)
+            for field_number, start, end in _length_delimited_fields(data, 0, len(data))
+            if field_number == _SET_FILE
+        ]
+
+class FileSelection:
+    # packages 匹配 package (如 game.battle.* 也包括 game.battle 本身)，files 匹配文件名;
+    # with_imports 时把选中文件 import 的文件也一并选中
+    __slots__ = ("packages", "files", "with_imports")
+
+    def __init__(self, packages=(), files=(), with_imports=False):
+        self.packages = tuple(packages)
+        self.files = tuple(files)
+        self.with_imports = with_imports
+
+    def cache_kind(self):
+        return f"only={','.join(self.packages)};files={','.join(self.files)};imports={int(self.with_imports)}"
+
+    def matches(self, file_descriptor):
+        package = file_descriptor.package
+        for pattern in self.packages:
+            if fnmatchcase(package, pattern):
+                return True
+            if pattern.endswith(".*") and package == pattern[:-2]:
+                return True
+
+        name = file_descriptor.name
+        for pattern in self.files:
+            if fnmatchcase(name, pattern) or fnmatchcase(name.rpartition("/")[2], pattern):
+                return True
+        return False
+
+    def select(self, file_descriptors):
+        # file_descriptors 是 FileEntry 或 FileDescriptorProto，结果保持原顺序
+        selected = {index for index, file_descriptor in enumerate(file_descriptors) if self.matches(file_descriptor)}
+        if self.with_imports:
+            selected |= _imported(file_descriptors, selected)
+        return [file_descriptors[index] for index in sorted(selected)]
+
+def _imported(file_descriptors, roots):
+    # roots 传递 import 的文件下标 (不含 roots 本身)
+    by_name = {file_descriptor.name: index for index, file_descriptor in enumerate(file_descriptors)}
+    imported = set()
+    pending = list(roots)
+    while pending:
+        for dependency in file_descriptors[pending.pop()].dependency:
+            index = by_name.get(dependency)
+            if index is not None and index not in roots and index not in imported:
+                imported.add(index)
+                pending.append(index)
+    return imported
+
+def dependencies(file_descriptors, selected):
+    # selected 里的文件传递 import 的、本身没有选中的文件，保持原顺序。
+    # 它们不渲染，但要加入符号表，否则类型引用会被缩写成 protoc 解析到别处的名字
+    selected_names = {file_descriptor.name for file_descriptor in selected}
+    roots = {index for index, file_descriptor in enumerate(file_descriptors) if file_descriptor.name in selected_names}
+    return [
+        file_descriptors[index] for index in sorted(_imported(file_descriptors, roots))
+        if file_descriptors[index].name not in selected_names
+    ]
+
+def parse_entry(data, entry):
+    file_proto = FileDescriptorProto()
+    with span("parse"):
+        file_proto.ParseFromString(data[entry.offset:entry.offset + entry.length])
+    return file_proto
+
+def parse_selected_files(data, selection):
+    # 只解析选中的条目和它们依赖的条目，返回 (选中的文件, 只用于符号表的依赖文件);
+    # data 不能按 FileDescriptorSet 建立索引时返回 None，由调用方完整解析后再筛选
+    try:
+        entries = index_file_set(data)
+    except ValueError:
+        return None
+    if not entries:
+        return None
+
+    selected = selection.select(entries)
+    try:
+        return (
+            [parse_entry(data, entry) for entry in selected],
+            [parse_entry(data, entry) for entry in dependencies(entries, selected)],
+        )
+    except Exception:
+        return None
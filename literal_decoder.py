@@ -0,0 +1,290 @@
+import re
+import ast
+import codecs
+
+# 各语言字符串字面量中转义序列的解码。
+# 先把整段字面量编码成 bytes。只用到与 Python bytes 字面量语义相同的转义时
+# (protoc 生成的代码基本都是这种情况)，直接交给 C 实现的 codecs.escape_decode；
+# 否则用一次 re.split 切成 普通文本/转义 交替的片段，转义通过缓存表批量查表替换。
+
+_ESCAPE_PATTERNS = {
+    # Java: 八进制最多 \377, 首位 4-7 时只取两位
+    "java": rb"\\(?:[0-3][0-7]{0,2}|[4-7][0-7]?|u+[0-9a-fA-F]{4}|.)",
+    "python": rb"\\(?:[0-7]{1,3}|x[0-9a-fA-F]{2}|\r?\n|.)",
+    "ruby": rb"\\(?:[0-7]{1,3}|x[0-9a-fA-F]{1,2}|u[0-9a-fA-F]{4}|u\{[0-9a-fA-F ]+\}|\r?\n|.)",
+    "php": rb"\\(?:[0-7]{1,3}|x[0-9a-fA-F]{1,2}|u\{[0-9a-fA-F]+\}|.)",
+    "cpp": rb"\\(?:[0-7]{1,3}|x[0-9a-fA-F]+|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|\r?\n|.)",
+}
+
+_SIMPLE_ESCAPES = {
+    "java": {b"b": b"\b", b"t": b"\t", b"n": b"\n", b"f": b"\f", b"r": b"\r", b"s": b" ",
+             b'"': b'"', b"'": b"'", b"\\": b"\\"},
+    "python": {b"a": b"\a", b"b": b"\b", b"f": b"\f", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"v": b"\v",
+               b'"': b'"', b"'": b"'", b"\\": b"\\"},
+    "ruby": {b"a": b"\a", b"b": b"\b", b"e": b"\x1b", b"f": b"\f", b"n": b"\n", b"r": b"\r", b"s": b" ",
+             b"t": b"\t", b"v": b"\v"},
+    "php": {b"e": b"\x1b", b"f": b"\f", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"v": b"\v",
+            b"$": b"$", b'"': b'"', b"\\": b"\\"},
+    "cpp": {b"a": b"\a", b"b": b"\b", b"e": b"\x1b", b"f": b"\f", b"n": b"\n", b"r": b"\r", b"t": b"\t",
+            b"v": b"\v", b"?": b"?", b'"': b'"', b"'": b"'", b"\\": b"\\"},
+}
+
+# 各语言中与 Python 语义完全一致的转义字符; C++ 的 \x 会吞掉后面所有十六进制位
+_COMMON_ESCAPES = {
+    "java": rb"0-7nrtfb\"'\\",
+    "python": rb"0-7nrtfbav\"'\\\n",
+    "ruby": rb"0-7nrtfbav\"'\\",
+    "php": rb"0-7nrtfv\"\\",
+    "cpp": rb"0-7nrtfbav\"'\\\n",
+}
+
+_HEX_ESCAPE_DIALECTS = {"python", "ruby", "php", "cpp"}
+
+# 无法识别的转义: python/php 保留反斜杠，其余语言只保留字符本身
+_KEEPS_UNKNOWN_BACKSLASH = {"python", "php"}
+
+# 源码里的普通字符怎么变成字节: Java 描述符字符串按 ISO-8859-1 取字节，其余按源文件 UTF-8
+_SOURCE_ENCODINGS = {"java": "latin-1"}
+
+_escape_regexes = {}
+_escape_caches = {}
+_uncommon_regexes = {}
+
+def _decode_escape(escape, dialect):
+    body = escape[1:]
+    first = body[:1]
+
+    if first in (b"\n", b"\r"):
+        # 行尾续行
+        return escape if dialect in ("php", "java") else b""
+
+    if first.isdigit() and first < b"8":
+        value = int(body, 8)
+        if value > 0xFF:
+            if dialect == "cpp":
+                raise ValueError(f"Octal escape out of range: \\{body.decode()}")
+            value &= 0xFF
+        return bytes((value,))
+
+    if first == b"x" and len(body) > 1:
+        value = int(body[1:], 16)
+        if value > 0xFF:
+            raise ValueError(f"Hex escape out of range: \\{body.decode()}")
+        return bytes((value,))
+
+    if first in (b"u", b"U") and len(body) > 1:
+        digits = body.lstrip(b"uU")
+        if digits.startswith(b"{"):
+            # Ruby 的 \u{41 42} 可以一次写多个码点
+            return b"".join(chr(int(part, 16)).encode("utf-8") for part in digits.strip(b"{}").split())
+
+        codepoint = int(digits, 16)
+        if dialect == "java":
+            if codepoint > 0xFF:
+                raise ValueError(f"Unicode escape out of byte range: \\{body.decode()}")
+            return bytes((codepoint,))
+        if codepoint > 0x10FFFF:
+            raise ValueError(f"Unicode escape out of range: \\{body.decode()}")
+        return chr(codepoint).encode("utf-8")
+
+    simple = _SIMPLE_ESCAPES[dialect].get(body)
+    if simple is not None:
+        return simple
+
+    if dialect in _KEEPS_UNKNOWN_BACKSLASH:
+        return escape
+    return body
+
+def _escape_regex(dialect):
+    regex = _escape_regexes.get(dialect)
+    if regex is None:
+        if dialect not in _ESCAPE_PATTERNS:
+            raise ValueError(f"Unsupported literal dialect: {dialect}")
+        regex = _escape_regexes[dialect] = re.compile(b"(" + _ESCAPE_PATTERNS[dialect] + b")", re.DOTALL)
+        _escape_caches[dialect] = {}
+
+        # 任一反斜杠后面不是公共转义，或者是超过 \377 的三位八进制，都走慢速路径
+        allowed = b"[" + _COMMON_ESCAPES[dialect] + b"]"
+        if dialect == "cpp":
+            allowed += rb"|x[0-9a-fA-F]{2}(?![0-9a-fA-F])"
+        elif dialect in _HEX_ESCAPE_DIALECTS:
+            allowed += rb"|x[0-9a-fA-F]{2}"
+        _uncommon_regexes[dialect] = re.compile(rb"\\(?!" + allowed + rb")|\\[4-7][0-7]{2}")
+    return regex
+
+# 检查转义时代替成对的 \\\\，不是十六进制或八进制数字，也不是任何转义字母
+_ESCAPED_BACKSLASH_PLACEHOLDER = b"--"
+
+def decode_c_literal(escaped, dialect):
+    regex = _escape_regex(dialect)
+
+    if isinstance(escaped, str):
+        escaped = escaped.encode(_SOURCE_ENCODINGS.get(dialect, "utf-8"))
+    elif dialect in _SOURCE_ENCODINGS and not escaped.isascii():
+        # 按字节定位时拿到的是源文件原始字节; 合法 UTF-8 时换成该语言的取字节方式，否则原样使用
+        try:
+            escaped = escaped.decode("utf-8").encode(_SOURCE_ENCODINGS[dialect])
+        except UnicodeError:
+            pass
+
+    if b"\\" not in escaped:
+        return escaped
+
+    # 成对的 \\\\ 换成不会构成转义的占位符后，剩下的每个反斜杠都是一个转义的开头;
+    # 直接删掉会把两侧的字符拼在一起，如 \x4 后面跟一对反斜杠和 F 时会被当成 \x4F
+    if _uncommon_regexes[dialect].search(escaped.replace(b"\\\\", _ESCAPED_BACKSLASH_PLACEHOLDER)) is None:
+        return codecs.escape_decode(escaped)[0]
+
+    parts = regex.split(escaped)
+    escapes = parts[1::2]
+    cache = _escape_caches[dialect]
+    values = list(map(cache.get, escapes))
+
+    if None in values:
+        for index, value in enumerate(values):
+            if value is None:
+                escape = escapes[index]
+                value = cache.get(escape)
+                if value is None:
+                    value = cache[escape] = _decode_escape(escape, dialect)
+                values[index] = value
+
+    parts[1::2] = values
+    return b"".join(parts)
+
+def decode_c_literals(fragments, dialect):
+    # 相邻字面量分别解码再拼接，避免 "\x1" "f" 这类跨片段的转义被合并
+    return b"".join(decode_c_literal(fragment, dialect) for fragment in fragments)
+
+# Python 字面量直接交给 ast.literal_eval，在 C 里解析，语义与解释器完全一致。
+# 参数是包含前缀和引号的源码，如 b'\n\x10...' 或相邻的多个字面量;
+# 老版本 protoc 用 _b('...') 包一层 str 字面量，按 latin-1 取字节。
+def decode_python_literal(literal):
+    if not isinstance(literal, str):
+        literal = literal.decode("utf-8")
+
+    # 加一层括号，跨行的相邻字面量也能作为一个表达式解析
+    value = ast.literal_eval(f"({literal})")
+    if isinstance(value, str):
+        value = value.encode("latin-1")
+    if not isinstance(value, bytes):
+        raise ValueError(f"Expected a bytes literal, got {type(value).__name__}")
+    return value
+
+# C++ descriptor_table_protodef_xxx[] 的两种写法:
+#   字符数组 { 'a', '\n', '\021', ... } 与相邻字符串字面量 { "..." "..." }
+# 两种写法都先拼成一整段 C++ 字面量再统一解码，元素之间插入 "\\\n" (行尾续行，解码为空)，
+# 这样 '\1', '2' 这类相邻元素不会被合并成一个转义。
+# 整体校验用占有量词 *+，避免 re 为每个元素保存回溯状态。
+_CPP_CHAR = rb"'(?:\\.[^'\\]*|[^'\\])'"
+_CPP_CHAR_REGEX = re.compile(rb"'(\\.[^'\\]*|[^'\\])'", re.DOTALL)
+_CPP_CHAR_ARRAY_REGEX = re.compile(rb"(?:" + _CPP_CHAR + rb", )*+" + _CPP_CHAR, re.DOTALL)
+_CPP_CHAR_LINE_BREAK_REGEX = re.compile(rb",[ \t]*\r?\n\s*")
+_CPP_STRING_REGEX = re.compile(rb'"((?:\\.|[^"\\])*+)"\s*', re.DOTALL)
+_CPP_STRING_ARRAY_REGEX = re.compile(rb'(?:"(?:\\.|[^"\\])*+"\s*)*+', re.DOTALL)
+
+# 字符数组按行切成约这么大的片段逐段解码，strip / sub / replace 的副本都只有一个片段大
+_CPP_CHAR_PIECE_SIZE = 64 * 1024
+
+def decode_cpp_char_array(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    # protoc 的排版是 "'a', 'b', ..." 每行若干个; 统一成 ", " 分隔后，
+    # 元素之间的 "', '" 不会与任何元素内容重叠，可以整段 replace 成续行。
+    # 片段只在换行处切开，不会切断元素
+    result = bytearray()
+    pos = 0
+    while pos < len(content):
+        cut = content.find(b"\n", pos + _CPP_CHAR_PIECE_SIZE)
+        if cut == -1:
+            cut = len(content)
+        piece = _CPP_CHAR_LINE_BREAK_REGEX.sub(b", ", content[pos:cut].strip()).rstrip(b", ")
+        pos = cut + 1
+        if not piece:
+            continue
+        if _CPP_CHAR_ARRAY_REGEX.fullmatch(piece) is None:
+            break
+        result += decode_c_literal(piece[1:-1].replace(b"', '", b"\\\n"), "cpp")
+    else:
+        if result:
+            return bytes(result)
+
+    # 其它排版或夹杂注释时逐个元素解码
+    return b"".join(decode_c_literal(match.group(1), "cpp") for match in _CPP_CHAR_REGEX.finditer(content))
+
+def decode_cpp_string_literals(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    content = content.lstrip()
+
+    # 字符串片段很长，按片段做一次 sub 即可
+    if _CPP_STRING_ARRAY_REGEX.fullmatch(content) is not None:
+        return decode_c_literal(_CPP_STRING_REGEX.sub(rb"\1\\\n", content), "cpp")
+
+    return b"".join(decode_c_literal(match.group(1), "cpp") for match in _CPP_STRING_REGEX.finditer(content))
+
+# Go 双引号字符串，语义与 strconv.Unquote 一致:
+# 八进制固定三位且不超过 \377，\x 固定两位，\u \U 按 UTF-8 编码，不允许 \' 和其它未知转义
+_GO_ESCAPE_REGEX = re.compile(
+    rb"\\(" rb"[abfnrtv\\\"]|[0-7]{3}|x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}" rb")"
+)
+_GO_UNCOMMON_REGEX = re.compile(rb"\\(?![abfnrtv\"]|[0-3][0-7]{2}|x[0-9a-fA-F]{2})")
+_GO_SIMPLE_ESCAPES = {
+    b"a": b"\a", b"b": b"\b", b"f": b"\f", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"v": b"\v",
+    b"\\": b"\\", b'"': b'"',
+}
+_go_escape_cache = {}
+
+def _decode_go_escape(body):
+    simple = _GO_SIMPLE_ESCAPES.get(body)
+    if simple is not None:
+        return simple
+
+    first = body[:1]
+    if first == b"x":
+        return bytes((int(body[1:], 16),))
+
+    if first in (b"u", b"U"):
+        codepoint = int(body[1:], 16)
+        if codepoint > 0x10FFFF or 0xD800 <= codepoint <= 0xDFFF:
+            raise ValueError(f"Invalid Unicode code point: \\{body.decode()}")
+        return chr(codepoint).encode("utf-8")
+
+    value = int(body, 8)
+    if value > 0xFF:
+        raise ValueError("Octal escape out of range")
+    return bytes((value,))
+
+def decode_go_literal(escaped):
+    if isinstance(escaped, str):
+        escaped = escaped.encode("utf-8")
+
+    if b"\\" not in escaped:
+        return escaped
+
+    # protoc-gen-go 只输出 \xHH、\" 等与 Python 一致的转义，整段交给 C 实现解码
+    if _GO_UNCOMMON_REGEX.search(escaped.replace(b"\\\\", _ESCAPED_BACKSLASH_PLACEHOLDER)) is None:
+        return codecs.escape_decode(escaped)[0]
+
+    # 切分后偶数下标是普通文本，奇数下标是转义体
+    parts = _GO_ESCAPE_REGEX.split(escaped)
+    for index in range(0, len(parts), 2):
+        text = parts[index]
+        position = text.find(b"\\")
+        if position != -1:
+            if position == len(text) - 1:
+                raise ValueError("Incomplete escape sequence")
+            raise ValueError(f"Unknown escape sequence: \\{text[position + 1:position + 2].decode('utf-8', 'replace')}")
+
+    for index in range(1, len(parts), 2):
+        body = parts[index]
+        value = _go_escape_cache.get(body)
+        if value is None:
+            value = _go_escape_cache[body] = _decode_go_escape(body)
+        parts[index] = value
+
+    return b"".join(parts)
+
+def decode_go_literals(fragments):
+    return b"".join(decode_go_literal(fragment) for fragment in fragments)
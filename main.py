@@ -1,13 +1,14 @@
 import sys
 import argparse
 from pathlib import Path
-from descriptor_extractor import extract_descriptor_data
-from proto_writer import generate_proto_file, process_pb_file
-from prost_extractor import convert_rust_to_proto
-import zig_extractor
-import betterproto_extractor
-import protobufnet_extractor
-import pbn_vb_extractor
+import tracing
+import render_cache
+import protobuf_backend
+from tracing import span
+from metrics import RunMetrics, MetricsWriter
+from descriptor_index import FileSelection
+from pipeline import FILE_PATTERNS, Pipeline, read_source, source_size, extract_source, stream_source
+from proto_writer import stream_mapped_pb_file
 
 def unquote_argument(arg):
     if arg.startswith('"') and arg.endswith('"'):
@@ -19,61 +20,49 @@ def print_usage():
     print("  --input, -i     Input file or directory path.")
     print("  --output, -o    Output directory path.")
     print("  --lang, -l      Source language.")
+    print("  --jobs, -j      Number of worker processes for extraction and rendering, also used to render the files of a single large .pb input in parallel (default: 1).")
+    print("  --trace         Write Chrome/Perfetto trace events to the given JSON file.")
+    print("  --metrics-file  Write Prometheus textfile metrics to the given path during and after the run.")
+    print("  --metrics-interval  Seconds between metrics file updates (default: 15).")
+    print("  --only          Only render .pb files whose package matches the pattern, e.g. 'game.battle.*' (repeatable).")
+    print("  --only-file     Only render .pb files whose name matches the pattern (repeatable).")
+    print("  --with-imports  Also render the files imported by the selected .pb files.")
+    print("  --low-memory    Map a single .pb input and render its files one at a time instead of loading the whole set.")
+    print("  --first-descriptor-only  For csharp/java, stop reading each source once its first descriptor is complete. "
+          "Much less is read from large generated files, but a source that merges several descriptors only yields the first.")
+    print("  --cache-dir     Cache rendered protos in the given directory, keyed by descriptor content.")
+    print("  --cache-size    Maximum render cache size in MB (default: 256).")
+    print("  --stats         Print run statistics and per-stage queue depths.")
     print("  --help, -h      Display this help message.")
 
-def process_file(file_path, output_dir, source_language, source_code):
-    if source_language == "prost":
-        proto_content = convert_rust_to_proto(source_code)
-        output_file = output_dir / (file_path.stem + ".proto")
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(proto_content)
-
-        print(f"Generated: {output_file}")
-    elif source_language == "zig":
-        proto_content = zig_extractor.convert_proto(source_code)
-        output_file = output_dir / (file_path.stem + ".proto")
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(proto_content)
-
-        print(f"Generated: {output_file}")
-    elif source_language == "betterproto":
-        proto_content = betterproto_extractor.convert_proto(source_code)
-        output_file = output_dir / (file_path.stem + ".proto")
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(proto_content)
-
-        print(f"Generated: {output_file}")
-    elif source_language == "pbn":
-        proto_content = protobufnet_extractor.convert_proto(source_code)
-        output_file = output_dir / (file_path.stem + ".proto")
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(proto_content)
-
-        print(f"Generated: {output_file}")
-    elif source_language == "pbnvb":
-        proto_content = pbn_vb_extractor.convert_proto(source_code)
-        output_file = output_dir / (file_path.stem + ".proto")
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(proto_content)
-
-        print(f"Generated: {output_file}")
-    elif source_language == "pb":
-        process_pb_file(file_path, output_dir)
-    else:
-        descriptor_data = extract_descriptor_data(source_code, source_language)
-        if not descriptor_data:
-            if input_path.is_file():
-                raise ValueError("DescriptorData not found in source code")
-            else:
-                print(f"Warning: DescriptorData not found in {file_path}. Skipping.")
-                return
+def process_mapped_pb_file(file_path, output_dir, metrics=None, selection=None):
+    for _ in stream_mapped_pb_file(file_path, output_dir, selection):
+        if metrics is not None:
+            metrics.proto_written()
+
+def process_file(file_path, output_dir, source_language, source_code, metrics=None, jobs=1, selection=None):
+    extracted = extract_source(file_path, source_code, source_language)
+    if extracted is None:
+        raise ValueError("DescriptorData not found in source code")
 
-        generate_proto_file(descriptor_data, output_dir, source_code, source_language)
+    for _ in stream_source(file_path, extracted, source_code, source_language, output_dir, jobs, selection):
+        if metrics is not None:
+            metrics.proto_written()
 
 if __name__ == "__main__":
     input_path = None
     output_dir = None
     source_language = None
+    jobs = 1
+    show_stats = False
+    trace_path = None
+    metrics_path = None
+    metrics_interval = 15.0
+    cache_dir = None
+    selection = None
+    low_memory = False
+    first_descriptor_only = False
+    cache_size = render_cache.DEFAULT_MAX_BYTES // (1024 * 1024)
 
     if input_path is None or output_dir is None or source_language is None:
         parser = argparse.ArgumentParser(add_help=False)
@@ -94,6 +83,71 @@ if __name__ == "__main__":
             choices=["csharp", "java", "go", "python", "ruby", "php", "cpp", "prost", "zig", "betterproto", "pbn", "pbnvb", "pb"],
             required=False,
         )
+        parser.add_argument(
+            "-j", "--jobs",
+            dest="jobs",
+            type=int,
+            default=1,
+        )
+        parser.add_argument(
+            "--trace",
+            dest="trace_path",
+            required=False,
+        )
+        parser.add_argument(
+            "--metrics-file",
+            dest="metrics_path",
+            required=False,
+        )
+        parser.add_argument(
+            "--metrics-interval",
+            dest="metrics_interval",
+            type=float,
+            default=15.0,
+        )
+        parser.add_argument(
+            "--only",
+            dest="only_packages",
+            action="append",
+            default=[],
+        )
+        parser.add_argument(
+            "--only-file",
+            dest="only_files",
+            action="append",
+            default=[],
+        )
+        parser.add_argument(
+            "--with-imports",
+            action="store_true",
+            dest="with_imports",
+        )
+        parser.add_argument(
+            "--low-memory",
+            action="store_true",
+            dest="low_memory",
+        )
+        parser.add_argument(
+            "--first-descriptor-only",
+            action="store_true",
+            dest="first_descriptor_only",
+        )
+        parser.add_argument(
+            "--cache-dir",
+            dest="cache_dir",
+            required=False,
+        )
+        parser.add_argument(
+            "--cache-size",
+            dest="cache_size",
+            type=int,
+            default=cache_size,
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            dest="show_stats",
+        )
         parser.add_argument(
             "-h", "--help",
             action="store_true",
@@ -110,6 +164,20 @@ if __name__ == "__main__":
             input_path = Path(unquote_argument(args.input_path))
             output_dir = Path(unquote_argument(args.output_directory))
             source_language = args.source_language.lower()
+        jobs = args.jobs
+        show_stats = args.show_stats
+        if args.trace_path:
+            trace_path = Path(unquote_argument(args.trace_path))
+        if args.metrics_path:
+            metrics_path = Path(unquote_argument(args.metrics_path))
+        metrics_interval = args.metrics_interval
+        if args.cache_dir:
+            cache_dir = Path(unquote_argument(args.cache_dir))
+        cache_size = args.cache_size
+        low_memory = args.low_memory
+        first_descriptor_only = args.first_descriptor_only
+        if args.only_packages or args.only_files:
+            selection = FileSelection(args.only_packages, args.only_files, args.with_imports)
     else:
         input_path = Path(input_path)
         output_dir = Path(output_dir)
@@ -119,67 +187,85 @@ if __name__ == "__main__":
         print_usage()
         sys.exit(1)
 
+    if selection is not None and source_language != "pb":
+        print("Error: --only and --only-file are only supported for pb input.", file=sys.stderr)
+        sys.exit(1)
+
+    if low_memory and (source_language != "pb" or not input_path.is_file()):
+        print("Error: --low-memory is only supported for a single .pb input file.", file=sys.stderr)
+        sys.exit(1)
+
     if not input_path.exists():
         print(f"Error: Input path not found: {input_path}", file=sys.stderr)
         sys.exit(1)
 
+    if trace_path is not None:
+        tracing.enable()
+
+    protobuf_backend.report()
+
+    if cache_dir is not None:
+        render_cache.enable(cache_dir, cache_size * 1024 * 1024)
+
+    metrics = None
+    metrics_writer = None
+    if metrics_path is not None:
+        metrics = RunMetrics(source_language)
+        metrics_writer = MetricsWriter(metrics, metrics_path, metrics_interval)
+        metrics_writer.start()
+
     try:
         output_dir.mkdir(parents=True, exist_ok=True)
 
-        if input_path.is_file():
-            if source_language == "pb":
-                with open(input_path, "rb") as f:
-                    source_code = f.read()
-            else:
-                with open(input_path, "r", encoding="utf-8") as f:
-                    source_code = f.read()
+        if input_path.is_file() and low_memory:
+            with tracing.current_file(input_path):
+                if metrics is not None:
+                    metrics.add_bytes_read(input_path.stat().st_size)
+
+                try:
+                    process_mapped_pb_file(input_path, output_dir, metrics, selection)
+                except Exception:
+                    if metrics is not None:
+                        metrics.file_failed()
+                    raise
+
+                if metrics is not None:
+                    metrics.file_processed()
+
+        elif input_path.is_file():
+            with tracing.current_file(input_path):
+                with span("read"):
+                    source_code = read_source(input_path, source_language, first_descriptor_only=first_descriptor_only)
+                if metrics is not None:
+                    metrics.add_bytes_read(source_size(input_path, source_code))
 
-            process_file(input_path, output_dir, source_language, source_code)
+                try:
+                    process_file(input_path, output_dir, source_language, source_code, metrics, jobs, selection)
+                except Exception:
+                    if metrics is not None:
+                        metrics.file_failed()
+                    raise
+
+                if metrics is not None:
+                    metrics.file_processed()
 
         elif input_path.is_dir():
-            if source_language == "csharp" or source_language == "pbn":
-                file_pattern = "*.cs"
-            elif source_language == "java":
-                file_pattern = "*.java"
-            elif source_language == "go":
-                file_pattern = "*.go"
-            elif source_language == "python" or source_language == "betterproto":
-                file_pattern = "*.py"
-            elif source_language == "ruby":
-                file_pattern = "*.rb"
-            elif source_language == "php":
-                file_pattern = "*.php"
-            elif source_language == "cpp":
-                file_pattern = "*.cc"
-            elif source_language == "prost":
-                file_pattern = "*.rs"
-            elif source_language == "zig":
-                file_pattern = "*.zig"
-            elif source_language == "pbnvb":
-                file_pattern = "*.vb"
-            elif source_language == "pb":
-                file_pattern = "*.pb"
-            else:
+            file_pattern = FILE_PATTERNS.get(source_language)
+            if file_pattern is None:
                 raise ValueError(f"Unsupported language: {source_language}")
-            source_files = list(input_path.rglob(file_pattern))
 
-            if not source_files:
+            pipeline = Pipeline(
+                output_dir, source_language, jobs=jobs, metrics=metrics, selection=selection,
+                first_descriptor_only=first_descriptor_only,
+            )
+            pipeline.run(input_path.rglob(file_pattern))
+
+            if not pipeline.discovered:
                 print(f"No {file_pattern} files found in {input_path}")
                 sys.exit()
 
-            for file_path in source_files:
-                try:
-                    if source_language == "pb":
-                        with open(file_path, "rb") as f:
-                            source_code = f.read()
-                    else:
-                        with open(file_path, "r", encoding="utf-8") as f:
-                            source_code = f.read()
-
-                    process_file(file_path, output_dir, source_language, source_code)
-
-                except Exception as e:
-                    print(f"Error processing file {file_path}: {str(e)}", file=sys.stderr)
+            if show_stats:
+                print(pipeline.summary())
 
         else:
             print(f"Error: Input path is neither file nor directory: {input_path}", file=sys.stderr)
@@ -190,3 +276,8 @@ if __name__ == "__main__":
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        if metrics_writer is not None:
+            metrics_writer.stop()
+        if trace_path is not None:
+            tracing.write_trace(trace_path)
@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import threading
+import protobuf_backend
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Prometheus textfile 格式，交给 node_exporter 的 textfile collector 读取
+PREFIX = "protoextractor"
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+def peak_rss_bytes():
+    if resource is None:
+        return 0
+
+    # Linux 上 ru_maxrss 单位是 KB，macOS 上是字节
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+class RunMetrics:
+    def __init__(self, source_language):
+        self.source_language = source_language
+        self.started = time.time()
+        self.files_processed = 0
+        self.files_skipped = 0
+        self.files_failed = 0
+        self.bytes_read = 0
+        self.protos_written = 0
+        self.stage_latency = {}
+        self._lock = threading.Lock()
+
+    def file_processed(self):
+        with self._lock:
+            self.files_processed += 1
+
+    def file_skipped(self):
+        with self._lock:
+            self.files_skipped += 1
+
+    def file_failed(self):
+        with self._lock:
+            self.files_failed += 1
+
+    def add_bytes_read(self, size):
+        with self._lock:
+            self.bytes_read += size
+
+    def proto_written(self):
+        with self._lock:
+            self.protos_written += 1
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            histogram = self.stage_latency.get(stage)
+            if histogram is None:
+                histogram = self.stage_latency[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def render(self, finished=False):
+        language = f'language="{self.source_language}"'
+        now = time.time()
+
+        with self._lock:
+            lines = [
+                f"# HELP {PREFIX}_files_processed_total Source files processed successfully.",
+                f"# TYPE {PREFIX}_files_processed_total counter",
+                f"{PREFIX}_files_processed_total{{{language}}} {self.files_processed}",
+                f"# HELP {PREFIX}_files_skipped_total Source files without an embedded descriptor.",
+                f"# TYPE {PREFIX}_files_skipped_total counter",
+                f"{PREFIX}_files_skipped_total{{{language}}} {self.files_skipped}",
+                f"# HELP {PREFIX}_files_failed_total Source files that failed to process.",
+                f"# TYPE {PREFIX}_files_failed_total counter",
+                f"{PREFIX}_files_failed_total{{{language}}} {self.files_failed}",
+                f"# HELP {PREFIX}_bytes_read_total Bytes read from source files.",
+                f"# TYPE {PREFIX}_bytes_read_total counter",
+                f"{PREFIX}_bytes_read_total{{{language}}} {self.bytes_read}",
+                f"# HELP {PREFIX}_protos_written_total Proto files written.",
+                f"# TYPE {PREFIX}_protos_written_total counter",
+                f"{PREFIX}_protos_written_total{{{language}}} {self.protos_written}",
+                f"# HELP {PREFIX}_stage_duration_seconds Per-file latency of each pipeline stage.",
+                f"# TYPE {PREFIX}_stage_duration_seconds histogram",
+            ]
+            for stage, histogram in self.stage_latency.items():
+                lines.extend(histogram.render(f"{PREFIX}_stage_duration_seconds", f'{language},stage="{stage}"'))
+
+        lines.extend([
+            f"# HELP {PREFIX}_protobuf_backend_info Active google.protobuf implementation.",
+            f"# TYPE {PREFIX}_protobuf_backend_info gauge",
+            f'{PREFIX}_protobuf_backend_info{{backend="{protobuf_backend.backend()}"}} 1',
+            f"# HELP {PREFIX}_peak_rss_bytes Peak resident set size of the run, including worker processes.",
+            f"# TYPE {PREFIX}_peak_rss_bytes gauge",
+            f"{PREFIX}_peak_rss_bytes {peak_rss_bytes()}",
+            f"# HELP {PREFIX}_run_duration_seconds Wall time since the run started.",
+            f"# TYPE {PREFIX}_run_duration_seconds gauge",
+            f"{PREFIX}_run_duration_seconds{{{language}}} {now - self.started:.3f}",
+            f"# HELP {PREFIX}_run_finished Whether the run has finished.",
+            f"# TYPE {PREFIX}_run_finished gauge",
+            f"{PREFIX}_run_finished{{{language}}} {1 if finished else 0}",
+            f"# HELP {PREFIX}_last_update_timestamp_seconds Time the metrics file was written.",
+            f"# TYPE {PREFIX}_last_update_timestamp_seconds gauge",
+            f"{PREFIX}_last_update_timestamp_seconds {now:.3f}",
+        ])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, finished=False):
+        # 先写临时文件再 rename，避免 node_exporter 读到半个文件
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render(finished))
+        os.replace(temp_path, path)
+
+class MetricsWriter:
+    def __init__(self, metrics, path, interval=15.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.metrics.write(self.path, finished=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.metrics.write(self.path)
+            except OSError as e:
+                print(f"Warning: Failed to write metrics file {self.path}: {e}", file=sys.stderr)
@@ -0,0 +1,134 @@
+import os
+import sys
+import filecmp
+import hashlib
+import threading
+from pathlib import Path
+
+# 所有 proto 输出都经过这里: 先写临时文件再 os.replace，其他进程不会读到写了一半的文件;
+# 内容与已有文件完全相同时不重写，不改动 mtime; 同一次运行里同名输出内容不同时报告冲突 (后写的覆盖先写的)。
+
+class _HashingStream:
+    # 流式写出时顺便计算内容摘要，用于冲突检测
+    __slots__ = ("stream", "digest")
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+
+    def write(self, text):
+        self.digest.update(text.encode("utf-8"))
+        return self.stream.write(text)
+
+class OutputWriter:
+    def __init__(self):
+        self.unchanged = 0
+        self.conflicts = 0
+        self._lock = threading.Lock()
+        self._created_dirs = set()
+        # 输出文件 -> (内容摘要, 来源)
+        self._written = {}
+
+    def ensure_dir(self, directory):
+        if directory not in self._created_dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            with self._lock:
+                self._created_dirs.add(directory)
+
+    def write_text(self, output_file, content, source=None):
+        output_file = Path(output_file)
+        self.ensure_dir(output_file.parent)
+
+        data = _encode(content)
+        if _has_content(output_file, data):
+            self._unchanged()
+        else:
+            temp_path = _temp_path(output_file)
+            try:
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, output_file)
+            except BaseException:
+                _remove(temp_path)
+                raise
+
+        self._record(output_file, hashlib.sha256(content.encode("utf-8")).digest(), source)
+        return output_file
+
+    def write_stream(self, output_file, render, source=None):
+        # render(stream) 把文本写入 stream; 先写到临时文件，和已有文件相同时丢弃
+        output_file = Path(output_file)
+        self.ensure_dir(output_file.parent)
+
+        temp_path = _temp_path(output_file)
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                stream = _HashingStream(f)
+                render(stream)
+
+            if _same_file(output_file, temp_path):
+                _remove(temp_path)
+                self._unchanged()
+            else:
+                os.replace(temp_path, output_file)
+        except BaseException:
+            _remove(temp_path)
+            raise
+
+        self._record(output_file, stream.digest.digest(), source)
+        return output_file
+
+    def _unchanged(self):
+        with self._lock:
+            self.unchanged += 1
+
+    def _record(self, output_file, digest, source):
+        key = os.path.normcase(os.path.abspath(output_file))
+        with self._lock:
+            previous = self._written.get(key)
+            self._written[key] = (digest, source)
+            if previous is None or previous[0] == digest:
+                return
+            self.conflicts += 1
+
+        previous_source = previous[1]
+        if source is not None and previous_source is not None:
+            detail = f"{source} replaced different content from {previous_source}"
+        else:
+            detail = "different content was already written in this run"
+        print(f"Warning: Conflicting output for {output_file}: {detail}", file=sys.stderr)
+
+def _encode(content):
+    # 与文本模式写入的字节完全一致
+    if os.linesep != "\n":
+        content = content.replace("\n", os.linesep)
+    return content.encode("utf-8")
+
+def _temp_path(output_file):
+    return f"{output_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def _has_content(path, data):
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, "rb") as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+def _same_file(path, temp_path):
+    try:
+        if os.path.getsize(path) != os.path.getsize(temp_path):
+            return False
+        return filecmp.cmp(path, temp_path, shallow=False)
+    except OSError:
+        return False
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# 一次运行共用一个，目录缓存和冲突检测覆盖所有输出
+writer = OutputWriter()
@@ -0,0 +1,90 @@
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import tracing
+import render_cache
+from proto_generator import generate_proto_from_descriptor
+from proto_writer import parse_pb_file, get_pb_proto_file_name, write_proto_file, write_cached_files, stream_files, pb_cache_kind
+
+# 把一个大的 FileDescriptorSet 按文件切成工作单元，在进程池里渲染，按原顺序写出。
+# 每个工作进程解析一次整个集合并建立符号表，之后只按下标渲染分到的文件;
+# fork 启动的进程直接继承主进程已解析的结果，不再重复解析。
+
+# 每个工作单元的文件数，太小时进程间传递结果的开销会超过渲染本身
+UNIT_SIZE = 16
+
+_file_protos = None
+_symbols = None
+
+def _load(file_path, descriptor_data, selection):
+    global _file_protos, _symbols
+    _file_protos, _symbols = parse_pb_file(file_path, descriptor_data, selection)
+
+def _unload():
+    global _file_protos, _symbols
+    _file_protos = None
+    _symbols = None
+
+def _init_worker(file_path, descriptor_data, selection, trace, cache_settings):
+    if trace:
+        tracing.init_worker()
+    if cache_settings is not None:
+        render_cache.init_worker(*cache_settings)
+    if _file_protos is None:
+        _load(file_path, descriptor_data, selection)
+
+def _render_unit(start, stop):
+    return [
+        (file_proto.name, generate_proto_from_descriptor(file_proto, _symbols)[0])
+        for file_proto in _file_protos[start:stop]
+    ]
+
+def render_units(file_path, descriptor_data, jobs, unit_size=UNIT_SIZE, selection=None):
+    # 在 _load 之后调用，按原顺序逐个返回 (描述符里的文件名, proto 文本)。
+    # 非 fork 启动的工作进程要从 descriptor_data 重新解析
+    file_count = len(_file_protos)
+    starts = range(0, file_count, unit_size)
+    stops = [min(start + unit_size, file_count) for start in starts]
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(file_path, descriptor_data, selection, tracing.is_enabled(), render_cache.settings()),
+    ) as executor:
+        if not tracing.is_enabled():
+            for rendered in executor.map(_render_unit, starts, stops):
+                yield from rendered
+            return
+
+        # 与 Pipeline._call 一样，工作进程记录的事件随每个单元的结果交回主进程
+        units = executor.map(tracing.traced_call, repeat(file_path), repeat(_render_unit), starts, stops)
+        for rendered, events in units:
+            tracing.extend(events)
+            yield from rendered
+
+def stream_pb_file_parallel(file_path, descriptor_data, output_path, jobs, unit_size=UNIT_SIZE, selection=None):
+    def output_name(descriptor_name):
+        return get_pb_proto_file_name(file_path, descriptor_name)
+
+    cache = render_cache.active()
+    key = None
+    if cache is not None:
+        key = cache.key(pb_cache_kind(selection), (descriptor_data,))
+        generated_files = write_cached_files(cache, key, output_path, output_name, file_path)
+        if generated_files is not None:
+            return generated_files
+
+    _load(file_path, descriptor_data, selection)
+    try:
+        if jobs <= 1 or len(_file_protos) <= unit_size:
+            return stream_files(_file_protos, output_path, output_name, cache, key, file_path, _symbols)
+
+        written = []
+        for descriptor_name, proto_content in render_units(file_path, descriptor_data, jobs, unit_size, selection):
+            output_file = write_proto_file(output_path, output_name(descriptor_name), proto_content, file_path)
+            written.append((descriptor_name, output_file))
+    finally:
+        _unload()
+
+    if cache is not None and written:
+        cache.put_files(key, written)
+    return [str(output_file) for _, output_file in written]
@@ -0,0 +1,363 @@
+import os
+import sys
+import time
+import mmap
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import tracing
+import strategies
+import render_cache
+from tracing import span
+from descriptor_extractor import extract_descriptor_data, PREFIX_LOCATORS
+from source_reader import PartialSource, read_descriptor_prefix
+from output_writer import writer
+from proto_writer import render_proto_files, render_pb_file, write_proto_file, stream_proto_files, stream_pb_file, name_source
+from parallel_render import stream_pb_file_parallel
+from prost_extractor import convert_rust_to_proto
+import zig_extractor
+import betterproto_extractor
+import protobufnet_extractor
+import pbn_vb_extractor
+
+FILE_PATTERNS = {
+    "csharp": "*.cs",
+    "pbn": "*.cs",
+    "java": "*.java",
+    "go": "*.go",
+    "python": "*.py",
+    "betterproto": "*.py",
+    "ruby": "*.rb",
+    "php": "*.php",
+    "cpp": "*.cc",
+    "prost": "*.rs",
+    "zig": "*.zig",
+    "pbnvb": "*.vb",
+    "pb": "*.pb",
+}
+
+# 直接从源码生成 proto 文本的语言，不经过 FileDescriptorProto
+CONVERTERS = {
+    "prost": convert_rust_to_proto,
+    "zig": zig_extractor.convert_proto,
+    "betterproto": betterproto_extractor.convert_proto,
+    "pbn": protobufnet_extractor.convert_proto,
+    "pbnvb": pbn_vb_extractor.convert_proto,
+}
+
+# 从内嵌描述符提取的语言，源码按字节处理
+DESCRIPTOR_LANGUAGES = {"csharp", "java", "go", "python", "ruby", "php", "cpp"}
+
+# 每个阶段的输入队列: read <- 待读取的路径, extract <- 源码, render <- 描述符, write <- 生成结果
+STAGES = ("read", "extract", "render", "write")
+
+_DONE = None
+
+def read_source(file_path, source_language, mapped=True, first_descriptor_only=False):
+    if source_language == "pb":
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    locator = PREFIX_LOCATORS.get(source_language) if first_descriptor_only else None
+    if locator is not None:
+        # 读到第一个描述符结束即可; 合并了多个描述符的源码只会得到第一个
+        return read_descriptor_prefix(file_path, *locator)
+
+    if source_language in DESCRIPTOR_LANGUAGES:
+        # 只读 mmap，按字节定位描述符，不把整个文件解码成 str
+        with open(file_path, "rb") as f:
+            if not mapped or os.fstat(f.fileno()).st_size == 0:
+                return f.read()
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def source_size(file_path, source_code):
+    if isinstance(source_code, PartialSource):
+        return len(source_code)
+    return file_path.stat().st_size
+
+def extract_source(file_path, source_code, source_language):
+    if source_language == "pb":
+        return source_code
+
+    converter = CONVERTERS.get(source_language)
+    if converter is not None:
+        return converter(source_code)
+
+    return extract_descriptor_data(source_code, source_language)
+
+def _process_context():
+    # 工作进程在第一次提交任务时才启动，此时各阶段的线程已经在运行;
+    # fork 会复制其它线程持有的锁 (stdout、tracing._lock)，子进程用到时会卡死，所以不用 fork
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+def _init_worker(trace, cache_settings):
+    if trace:
+        tracing.init_worker()
+    if cache_settings is not None:
+        render_cache.init_worker(*cache_settings)
+
+def _extract_in_worker(file_path, source_code, source_language):
+    # 工作进程里的策略命中次数随结果一起交回主进程
+    return extract_source(file_path, source_code, source_language), strategies.drain_hits()
+
+def render_source(file_path, extracted, source_code, source_language, selection=None):
+    if source_language == "pb":
+        return render_pb_file(file_path, extracted, selection)
+
+    if source_language in CONVERTERS:
+        return [(file_path.stem + ".proto", extracted)]
+
+    return render_proto_files(extracted, source_code, source_language)
+
+def stream_source(file_path, extracted, source_code, source_language, output_dir, jobs=1, selection=None):
+    # 单文件模式不经过 render/write 阶段，直接把 proto 文本流式写入输出文件
+    if source_language == "pb":
+        if jobs > 1:
+            # 单个 .pb 里的大集合按文件拆开并行渲染
+            return stream_pb_file_parallel(file_path, extracted, output_dir, jobs, selection=selection)
+        return stream_pb_file(file_path, extracted, output_dir, selection)
+
+    if source_language in CONVERTERS:
+        return [write_proto_file(output_dir, file_path.stem + ".proto", extracted, file_path)]
+
+    return stream_proto_files(extracted, output_dir, source_code, source_language)
+
+class WorkItem:
+    __slots__ = ("file_path", "source_code", "extracted", "outputs")
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.source_code = None
+        self.extracted = None
+        self.outputs = None
+
+class Pipeline:
+    def __init__(self, output_dir, source_language, jobs=1, io_workers=4, queue_size=64, write_batch=32, metrics=None,
+                 selection=None, first_descriptor_only=False):
+        self.output_dir = Path(output_dir)
+        self.source_language = source_language
+        self.selection = selection
+        self.first_descriptor_only = first_descriptor_only
+        self.jobs = max(1, jobs)
+        self.io_workers = max(1, io_workers)
+        self.write_batch = max(1, write_batch)
+        self.metrics = metrics
+
+        self.queues = {stage: queue.Queue(maxsize=queue_size) for stage in STAGES}
+        self.peak_depths = dict.fromkeys(STAGES, 0)
+
+        self.discovered = 0
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.generated = 0
+
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def run(self, source_files):
+        if self.jobs > 1:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.jobs,
+                mp_context=_process_context(),
+                initializer=_init_worker,
+                initargs=(tracing.is_enabled(), render_cache.settings()),
+            )
+
+        workers = {
+            "read": self._start_workers("read", self._read, self.io_workers),
+            "extract": self._start_workers("extract", self._extract, self.jobs),
+            "render": self._start_workers("render", self._render, self.jobs),
+            "write": self._start_workers("write", None, 1),
+        }
+
+        try:
+            # discovery 在调用线程里进行，read 队列满时自然阻塞
+            for file_path in source_files:
+                self.discovered += 1
+                self._put("read", WorkItem(file_path))
+        finally:
+            for stage in STAGES:
+                for _ in workers[stage]:
+                    self.queues[stage].put(_DONE)
+                for thread in workers[stage]:
+                    thread.join()
+
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+        return self.processed, self.failed
+
+    def summary(self):
+        depths = ", ".join(f"{stage}={depth}" for stage, depth in self.peak_depths.items())
+        lines = [
+            f"Files: {self.discovered} discovered, {self.processed} processed, "
+            f"{self.skipped} skipped, {self.failed} failed; {self.generated} protos generated "
+            f"({writer.unchanged} unchanged, {writer.conflicts} conflicting)",
+            f"Peak queue depths: {depths}",
+        ]
+
+        strategy_summary = strategies.summary()
+        if strategy_summary:
+            lines.append(strategy_summary)
+        return "\n".join(lines)
+
+    def _start_workers(self, stage, handler, count):
+        threads = []
+        for index in range(count):
+            if stage == "write":
+                target, args = self._write_loop, ()
+            else:
+                target, args = self._stage_loop, (stage, handler)
+
+            thread = threading.Thread(target=target, args=args, name=f"{stage}-{index}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _put(self, stage, item):
+        stage_queue = self.queues[stage]
+        stage_queue.put(item)
+
+        depth = stage_queue.qsize()
+        if depth > self.peak_depths[stage]:
+            with self._lock:
+                self.peak_depths[stage] = max(self.peak_depths[stage], depth)
+
+    def _stage_loop(self, stage, handler):
+        next_stage = STAGES[STAGES.index(stage) + 1]
+        stage_queue = self.queues[stage]
+
+        while True:
+            item = stage_queue.get()
+            if item is _DONE:
+                return
+
+            started = time.perf_counter()
+            try:
+                with tracing.current_file(item.file_path):
+                    forward = handler(item)
+            except Exception as e:
+                self._fail(item, e)
+                continue
+
+            if self.metrics is not None:
+                self.metrics.observe_stage(stage, time.perf_counter() - started)
+
+            if forward:
+                self._put(next_stage, item)
+
+    def _call(self, file_path, func, *args):
+        if self._executor is None:
+            return func(*args)
+
+        if not tracing.is_enabled():
+            return self._executor.submit(func, *args).result()
+
+        result, events = self._executor.submit(tracing.traced_call, file_path, func, *args).result()
+        tracing.extend(events)
+        return result
+
+    def _read(self, item):
+        with span("read"):
+            # mmap 不能传给工作进程，多进程时直接读成 bytes
+            item.source_code = read_source(
+                item.file_path, self.source_language, mapped=self._executor is None,
+                first_descriptor_only=self.first_descriptor_only,
+            )
+
+        if self.metrics is not None:
+            self.metrics.add_bytes_read(source_size(item.file_path, item.source_code))
+        return True
+
+    def _extract(self, item):
+        if self._executor is None:
+            item.extracted = extract_source(item.file_path, item.source_code, self.source_language)
+        else:
+            item.extracted, hits = self._call(
+                item.file_path, _extract_in_worker, item.file_path, item.source_code, self.source_language
+            )
+            strategies.merge_hits(hits)
+
+        if item.extracted is None:
+            print(f"Warning: DescriptorData not found in {item.file_path}. Skipping.")
+            with self._lock:
+                self.skipped += 1
+            if self.metrics is not None:
+                self.metrics.file_skipped()
+            return False
+
+        return True
+
+    def _render(self, item):
+        source_code = item.source_code
+        if self._executor is not None and self.source_language in DESCRIPTOR_LANGUAGES:
+            # extract 已经把整个源码传过一次，render 只需要推断文件名用到的部分
+            source_code = name_source(item.extracted, source_code, self.source_language)
+
+        item.outputs = self._call(
+            item.file_path, render_source, item.file_path, item.extracted, source_code, self.source_language,
+            self.selection,
+        )
+        item.source_code = None
+        item.extracted = None
+        return True
+
+    def _write_loop(self):
+        stage_queue = self.queues["write"]
+
+        while True:
+            batch = [stage_queue.get()]
+            while batch[-1] is not _DONE and len(batch) < self.write_batch:
+                try:
+                    batch.append(stage_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            done = batch[-1] is _DONE
+            if done:
+                batch.pop()
+
+            self._write_batch(batch)
+
+            if done:
+                return
+
+    def _write_batch(self, batch):
+        # 已创建的目录由 writer 记住，同一目录只 mkdir 一次
+        for item in batch:
+            started = time.perf_counter()
+            try:
+                for proto_file_name, proto_content in item.outputs:
+                    output_file = self.output_dir / proto_file_name
+                    with span("write", file=str(item.file_path)):
+                        writer.write_text(output_file, proto_content, item.file_path)
+
+                    print(f"Generated: {output_file}")
+                    self.generated += 1
+                    if self.metrics is not None:
+                        self.metrics.proto_written()
+            except Exception as e:
+                self._fail(item, e)
+                continue
+
+            with self._lock:
+                self.processed += 1
+            if self.metrics is not None:
+                self.metrics.observe_stage("write", time.perf_counter() - started)
+                self.metrics.file_processed()
+
+    def _fail(self, item, error):
+        print(f"Error processing file {item.file_path}: {str(error)}", file=sys.stderr)
+        with self._lock:
+            self.failed += 1
+        if self.metrics is not None:
+            self.metrics.file_failed()
@@ -1,8 +1,56 @@
 from typing import Tuple, Optional
 import google.protobuf.descriptor_pb2 as descriptor_pb2
+from tracing import span
+from symbol_table import SymbolTable
 
-def generate_proto_content(file_descriptor):
+# 渲染结果会被缓存 (render_cache)，生成的文本有任何变化时都要修改这个版本号
+GENERATOR_VERSION = "3"
+
+STREAM_BUFFER_LINES = 4096
+
+class StreamLines:
+    # 与 list 一样通过 append 逐行接收输出，攒够 buffer_lines 行就写入 stream，
+    # 写出的内容与 "\n".join(lines) 完全相同
+    __slots__ = ("stream", "buffer_lines", "buffer", "started")
+
+    def __init__(self, stream, buffer_lines=STREAM_BUFFER_LINES):
+        self.stream = stream
+        self.buffer_lines = buffer_lines
+        self.buffer = []
+        self.started = False
+
+    def append(self, line):
+        buffer = self.buffer
+        buffer.append(line)
+        if len(buffer) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        if self.started:
+            self.stream.write("\n")
+        self.stream.write("\n".join(self.buffer))
+
+        self.started = True
+        self.buffer.clear()
+
+def generate_proto_content(file_descriptor, symbols=None):
     lines = []
+    generate_proto_lines(file_descriptor, lines, symbols)
+    return "\n".join(lines)
+
+def write_proto_content(file_descriptor, stream, symbols=None, buffer_lines=STREAM_BUFFER_LINES):
+    # 边生成边写入 stream，内存占用只与缓冲的行数有关
+    lines = StreamLines(stream, buffer_lines)
+    generate_proto_lines(file_descriptor, lines, symbols)
+    lines.flush()
+
+def generate_proto_lines(file_descriptor, lines, symbols=None):
+    # symbols: 描述符集合共用的 SymbolTable，没有时只用当前文件建一个
+    if symbols is None:
+        symbols = SymbolTable([file_descriptor])
 
     syntax = file_descriptor.syntax if file_descriptor.syntax else "proto3"
     lines.append(f'syntax = "{syntax}";\n')
@@ -19,10 +67,9 @@ def generate_proto_content(file_descriptor):
     for enum in file_descriptor.enum_type:
         generate_enum(enum, lines, 0)
 
+    scope = f".{file_descriptor.package}" if file_descriptor.package else ""
     for message in file_descriptor.message_type:
-        generate_message(message, lines, 0)
-
-    return "\n".join(lines)
+        generate_message(message, lines, 0, scope, symbols)
 
 def generate_enum(enum_desc, lines, indent_level):
     indent = "    " * indent_level
@@ -32,137 +79,162 @@ def generate_enum(enum_desc, lines, indent_level):
     lines.append(f"{indent}}}")
     lines.append("")
 
-def generate_message(message_desc, lines, indent_level):
+class MessageIndex:
+    # 每个 message 只遍历一次字段和嵌套类型，建立 map 字段与 oneof 分组的索引。
+    # upb 后端每次访问重复字段都会创建新的包装对象、每次读字符串字段都会新建 str，
+    # 所以重复字段和 type_name 都只取一次，只有声明了 oneof 的 message 才调用 HasField
+    __slots__ = ("full_name", "symbols", "map_fields", "plain_fields", "oneof_groups", "nested_messages")
+
+    def __init__(self, message_desc, scope, symbols=None):
+        self.full_name = f"{scope}.{message_desc.name}"
+        self.symbols = symbols
+
+        # map entry 的全名 -> entry，按全名匹配字段的 type_name
+        map_entries = {}
+        self.nested_messages = []
+        for nested in message_desc.nested_type:
+            if nested.HasField("options") and nested.options.map_entry:
+                map_entries[f"{self.full_name}.{nested.name}"] = nested
+            else:
+                self.nested_messages.append(nested)
+
+        has_oneofs = len(message_desc.oneof_decl) > 0
+
+        entry_fields = {}
+        self.plain_fields = []
+        self.oneof_groups = {}
+        for field in message_desc.field:
+            if has_oneofs and field.HasField("oneof_index"):
+                self.oneof_groups.setdefault(field.oneof_index, []).append(field)
+                continue
+
+            if map_entries:
+                type_name = field.type_name
+                entry = map_entries.get(type_name)
+                if entry is not None:
+                    entry_fields.setdefault(type_name, field)
+                    continue
+
+            self.plain_fields.append(field)
+
+        # 按嵌套类型的声明顺序输出 map 字段
+        self.map_fields = [
+            (entry_fields[name], entry) for name, entry in map_entries.items() if name in entry_fields
+        ]
+
+def generate_message(message_desc, lines, indent_level, scope="", symbols=None):
     indent = "    " * indent_level
+    index = MessageIndex(message_desc, scope, symbols)
     lines.append(f"{indent}message {get_simple_type_name(message_desc.name)} {{")
 
-    generate_map_fields(message_desc, lines, indent_level)
-
-    for field in message_desc.field:
-        if field.HasField("oneof_index"):
-            continue
-
-        if is_map_field(field, message_desc):
-            continue
+    generate_map_fields(index, lines, indent_level)
 
+    for field in index.plain_fields:
         field_label = get_field_label(field)
-        field_type = get_field_type(field)
+        field_type = get_field_type(field, index)
         lines.append(f"{indent}    {field_label}{field_type} {field.name} = {field.number};")
 
-    generate_oneof_fields(message_desc, lines, indent_level)
+    generate_oneof_fields(message_desc, index, lines, indent_level)
 
-    generate_nested_types(message_desc, lines, indent_level)
+    generate_nested_types(message_desc, index, lines, indent_level)
 
     lines.append(f"{indent}}}")
     lines.append("")
 
-def generate_map_fields(message_desc, lines, indent_level):
+def generate_map_fields(index, lines, indent_level):
     indent = "    " * indent_level
-    for nested in message_desc.nested_type:
-        if nested.options.map_entry:
-            map_field = find_map_field(nested, message_desc)
-            if map_field:
-                key_field, value_field = get_map_entry_fields(nested)
-                key_type = get_field_type(key_field)
-                value_type = get_field_type(value_field)
-                lines.append(f"{indent}    map<{key_type}, {value_type}> {map_field.name} = {map_field.number};")
-
-def is_map_field(field, message_desc):
-    for nested in message_desc.nested_type:
-        if nested.options.map_entry:
-            if field.type_name.endswith(nested.name):
-                return True
-    return False
-
-def generate_oneof_fields(message_desc, lines, indent_level):
-    if not message_desc.oneof_decl:
+    for map_field, entry in index.map_fields:
+        key_field, value_field = get_map_entry_fields(entry)
+        key_type = get_field_type(key_field, index)
+        value_type = get_field_type(value_field, index)
+        lines.append(f"{indent}    map<{key_type}, {value_type}> {map_field.name} = {map_field.number};")
+
+def generate_oneof_fields(message_desc, index, lines, indent_level):
+    if not index.oneof_groups:
         return
 
     indent = "    " * indent_level
-    oneof_groups = group_oneof_fields(message_desc)
+    oneof_decl = message_desc.oneof_decl
 
-    for index, fields in oneof_groups.items():
-        if index >= len(message_desc.oneof_decl):
+    for oneof_index, fields in index.oneof_groups.items():
+        if oneof_index >= len(oneof_decl):
             continue
 
-        oneof_name = message_desc.oneof_decl[index].name
+        oneof_name = oneof_decl[oneof_index].name
         lines.append(f"{indent}    oneof {oneof_name} {{")
         for field in fields:
-            field_type = get_field_type(field)
+            field_type = get_field_type(field, index)
             lines.append(f"{indent}        {field_type} {field.name} = {field.number};")
         lines.append(f"{indent}    }}")
 
-def generate_nested_types(message_desc, lines, indent_level):
+def generate_nested_types(message_desc, index, lines, indent_level):
     for enum in message_desc.enum_type:
         generate_enum(enum, lines, indent_level + 1)
-    for nested in message_desc.nested_type:
-        if not nested.options.map_entry:
-            generate_message(nested, lines, indent_level + 1)
-
-def find_map_field(map_entry, parent_desc):
-    for field in parent_desc.field:
-        if field.type_name.endswith(map_entry.name):
-            return field
-    return None
+    for nested in index.nested_messages:
+        generate_message(nested, lines, indent_level + 1, index.full_name, index.symbols)
 
 def get_map_entry_fields(map_entry):
-    return map_entry.field[0], map_entry.field[1]
-
-def group_oneof_fields(message_desc):
-    oneof_groups = {}
-    for field in message_desc.field:
-        if field.HasField("oneof_index"):
-            index = field.oneof_index
-            oneof_groups.setdefault(index, []).append(field)
-    return oneof_groups
+    fields = map_entry.field
+    return fields[0], fields[1]
 
 def get_field_label(field):
-    if field.label == field.LABEL_REPEATED:
+    if field.label == _LABEL_REPEATED:
         return "repeated "
     if field.proto3_optional:
         return "optional "
     return ""
 
-def get_field_type(field):
-    if field.HasField("type_name"):
-        return get_simple_type_name(field.type_name)
-
-    type_mapping = {
-        field.TYPE_DOUBLE: "double",
-        field.TYPE_FLOAT: "float",
-        field.TYPE_INT64: "int64",
-        field.TYPE_UINT64: "uint64",
-        field.TYPE_INT32: "int32",
-        field.TYPE_FIXED64: "fixed64",
-        field.TYPE_FIXED32: "fixed32",
-        field.TYPE_BOOL: "bool",
-        field.TYPE_STRING: "string",
-        field.TYPE_BYTES: "bytes",
-        field.TYPE_UINT32: "uint32",
-        field.TYPE_SFIXED32: "sfixed32",
-        field.TYPE_SFIXED64: "sfixed64",
-        field.TYPE_SINT32: "sint32",
-        field.TYPE_SINT64: "sint64",
-    }
-    return type_mapping.get(field.type, "unknown")
+_FieldDescriptorProto = descriptor_pb2.FieldDescriptorProto
+
+# 经由消息实例取枚举常量要走一次 upb 的属性查找
+_LABEL_REPEATED = _FieldDescriptorProto.LABEL_REPEATED
+
+SCALAR_TYPES = {
+    _FieldDescriptorProto.TYPE_DOUBLE: "double",
+    _FieldDescriptorProto.TYPE_FLOAT: "float",
+    _FieldDescriptorProto.TYPE_INT64: "int64",
+    _FieldDescriptorProto.TYPE_UINT64: "uint64",
+    _FieldDescriptorProto.TYPE_INT32: "int32",
+    _FieldDescriptorProto.TYPE_FIXED64: "fixed64",
+    _FieldDescriptorProto.TYPE_FIXED32: "fixed32",
+    _FieldDescriptorProto.TYPE_BOOL: "bool",
+    _FieldDescriptorProto.TYPE_STRING: "string",
+    _FieldDescriptorProto.TYPE_BYTES: "bytes",
+    _FieldDescriptorProto.TYPE_UINT32: "uint32",
+    _FieldDescriptorProto.TYPE_SFIXED32: "sfixed32",
+    _FieldDescriptorProto.TYPE_SFIXED64: "sfixed64",
+    _FieldDescriptorProto.TYPE_SINT32: "sint32",
+    _FieldDescriptorProto.TYPE_SINT64: "sint64",
+}
+
+def get_field_type(field, index=None):
+    type_name = field.type_name
+    if type_name:
+        if index is None or index.symbols is None:
+            return get_simple_type_name(type_name)
+        # 按所在 message 的作用域输出最短的无歧义名字
+        return index.symbols.qualify(type_name, index.full_name)
+    return SCALAR_TYPES.get(field.type, "unknown")
 
 def get_simple_type_name(full_name):
     if full_name.startswith("."):
         full_name = full_name[1:]
     return full_name.split(".")[-1]
 
-def generate_proto_from_bytes(descriptor_bytes: bytes) -> Tuple[str, Optional[str]]:
-
-    file_descriptor = descriptor_pb2.FileDescriptorProto()
-    file_descriptor.ParseFromString(descriptor_bytes)
-
-    proto_content = generate_proto_content(file_descriptor)
+def generate_proto_from_descriptor(file_descriptor, symbols=None) -> Tuple[str, Optional[str]]:
+    # 直接使用已解析的 FileDescriptorProto，不再序列化后重新解析
+    with span("render"):
+        proto_content = generate_proto_content(file_descriptor, symbols)
 
     # name
-    proto_filename = file_descriptor.name
-    if proto_filename:
-        proto_filename = proto_filename
-    else:
-        proto_filename = None
+    proto_filename = file_descriptor.name or None
 
     return proto_content, proto_filename
+
+def generate_proto_from_bytes(descriptor_bytes: bytes) -> Tuple[str, Optional[str]]:
+
+    file_descriptor = descriptor_pb2.FileDescriptorProto()
+    with span("parse"):
+        file_descriptor.ParseFromString(descriptor_bytes)
+
+    return generate_proto_from_descriptor(file_descriptor)
@@ -1,213 +1,403 @@
 from pathlib import Path
+import os
 import re
+import mmap
 import sys
-from proto_generator import generate_proto_from_bytes
+import render_cache
+from proto_generator import generate_proto_from_descriptor, write_proto_content
+from symbol_table import SymbolTable
+from tracing import span
+from source_reader import PartialSource
+from source_scanner import preceded_by, LOOKBEHIND_WINDOW
+from output_writer import writer
+from descriptor_index import index_file, index_file_set, parse_entry, parse_selected_files, dependencies
 from google.protobuf.descriptor_pb2 import FileDescriptorSet, FileDescriptorProto
 
-def get_proto_file_name(source_code, file_descriptor, source_language):
-    if file_descriptor.name:
-        return Path(file_descriptor.name).name
+# protoc 生成的文件头部: 版权/source: 注释、import 和 Reflection/外层类声明
+HEADER_SIZE = 16 * 1024
+
+_SLASH_SOURCE_COMMENT = re.compile(rb'^//\s*source:\s*(.+?\.proto)\s*$', re.MULTILINE)
+_HASH_SOURCE_COMMENT = re.compile(rb'^#\s*source:\s*(.+?\.proto)\s*$', re.MULTILINE)
+_CPP_SOURCE_COMMENT = re.compile(rb'^//\s*source:\s*(.+?\.proto)\s*$')
+_CSHARP_REFLECTION_CLASS = re.compile(rb'public\s+static\s+partial\s+class\s+(\w+)Reflection\b')
+_JAVA_OUTER_CLASS = re.compile(rb"public\s+final\s+class\s+(\w+)(?:OuterClass)?\s*\{")
+_PHP_CLASS = re.compile(rb'class\s+(\w+)\s*\{')
+_GO_RAW_DESC = b"_proto_rawDesc"
+_GO_RAW_DESC_VAR = re.compile(rb'var\s+file_(\w+)$')
+_CPP_PROTODEF = b"descriptor_table_protodef_"
+_CPP_PROTODEF_DECLARATION = re.compile(rb'const\s+char\s+$')
+_CPP_PROTODEF_NAME = re.compile(rb'(\w+)\[\]')
+
+def get_source_proto_file_name(source_code, source_language):
+    name = detect_proto_name(source_code, source_language)
+    if (name is None and isinstance(source_code, PartialSource) and not source_code.complete
+            and len(source_code) < HEADER_SIZE):
+        # 只读了描述符之前的部分，还没读完文件头部
+        name = detect_proto_name(source_code.read_full(), source_language)
+
+    if name:
+        return name
+
+    raise ValueError(
+        "Cannot determine proto filename: Missing FileDescriptorProto.name and "
+        "no recognizable pattern in source code"
+    )
+
+def detect_proto_name(source_code, source_language):
+    # 只在描述符没有文件名时调用。protoc 把 source: 注释和 Reflection/外层类声明写在文件开头，
+    # 只在开头 HEADER_SIZE 字节内按字节匹配; Go/C++ 的变量名从描述符锚点处向前确认，不扫描整个源码
+    if isinstance(source_code, str):
+        source_code = source_code.encode("utf-8")
 
-    name = None
     if source_language == 'csharp':
-        name = get_csharp_proto_name(source_code)
+        return get_csharp_proto_name(source_code[:HEADER_SIZE])
     elif source_language == 'java':
-        name = get_java_proto_name(source_code)
+        return get_java_proto_name(source_code[:HEADER_SIZE])
     elif source_language == 'go':
-        name = get_go_proto_name(source_code)
+        return get_go_proto_name(source_code)
     elif source_language == 'python':
-        name = get_python_proto_name(source_code)
+        return get_python_proto_name(source_code[:HEADER_SIZE])
     elif source_language == 'ruby':
-        name = get_ruby_proto_name(source_code)
+        return get_ruby_proto_name(source_code[:HEADER_SIZE])
     elif source_language == 'php':
-        name = get_php_proto_name(source_code)
+        return get_php_proto_name(source_code[:HEADER_SIZE])
     elif source_language == 'cpp':
-        name = get_cpp_proto_name(source_code)
+        return get_cpp_proto_name(source_code)
+    return None
 
-    if name:
-        return name
+def _source_comment_name(pattern, header):
+    source_match = pattern.search(header)
+    if source_match:
+        return Path(_text(source_match.group(1))).name
+    return None
 
-    raise ValueError(
-        "Cannot determine proto filename: Missing FileDescriptorProto.name and "
-        "no recognizable pattern in source code"
-    )
+def _text(name):
+    return name.decode("utf-8", errors="replace")
 
-def get_csharp_proto_name(csharp_code):
-    source_match = re.search(r'^//\s*source:\s*(.+?\.proto)\s*$', csharp_code, re.MULTILINE)
-    if source_match:
-        return Path(source_match.group(1)).name
+def get_csharp_proto_name(header):
+    name = _source_comment_name(_SLASH_SOURCE_COMMENT, header)
+    if name:
+        return name
 
-    pattern = re.compile(r'public\s+static\s+partial\s+class\s+(\w+)Reflection\b')
-    match = pattern.search(csharp_code)
+    match = _CSHARP_REFLECTION_CLASS.search(header)
     if match:
-        return f"{match.group(1)}.proto"
+        return f"{_text(match.group(1))}.proto"
 
     return None
 
-def get_java_proto_name(java_code):
-    class_pattern = r"public\s+final\s+class\s+(\w+)(?:OuterClass)?\s*\{"
-    match = re.search(class_pattern, java_code)
+def get_java_proto_name(header):
+    match = _JAVA_OUTER_CLASS.search(header)
     if match:
-        class_name = match.group(1)
+        class_name = _text(match.group(1))
         if class_name.endswith("OuterClass"):
             class_name = class_name[:-len("OuterClass")]
         return f"{class_name}.proto"
     return None
 
 def get_go_proto_name(go_code):
-    source_match = re.search(r'^//\s*source:\s*(.+?\.proto)\s*$', go_code, re.MULTILINE)
-    if source_match:
-        return Path(source_match.group(1)).name
+    name = _source_comment_name(_SLASH_SOURCE_COMMENT, go_code[:HEADER_SIZE])
+    if name:
+        return name
 
-    pattern = re.compile(r'var\s+file_(\w+)_proto_rawDesc')
-    match = pattern.search(go_code)
-    if match:
-        return f"{match.group(1)}.proto"
+    # rawDesc 变量在描述符处，不在文件头部
+    pos = go_code.find(_GO_RAW_DESC)
+    while pos != -1:
+        match = _GO_RAW_DESC_VAR.search(go_code, max(0, pos - LOOKBEHIND_WINDOW), pos)
+        if match:
+            return f"{_text(match.group(1))}.proto"
+        pos = go_code.find(_GO_RAW_DESC, pos + len(_GO_RAW_DESC))
 
     return None
 
-def get_python_proto_name(python_code):
-    source_match = re.search(r'^#\s*source:\s*(.+?\.proto)\s*$', python_code, re.MULTILINE)
-    if source_match:
-        return Path(source_match.group(1)).name
-    return None
+def get_python_proto_name(header):
+    return _source_comment_name(_HASH_SOURCE_COMMENT, header)
 
-def get_ruby_proto_name(ruby_code):
-    source_match = re.search(r'^#\s*source:\s*(.+?\.proto)\s*$', ruby_code, re.MULTILINE)
-    if source_match:
-        return Path(source_match.group(1)).name
-    return None
+def get_ruby_proto_name(header):
+    return _source_comment_name(_HASH_SOURCE_COMMENT, header)
 
-def get_php_proto_name(php_code):
-    source_match = re.search(r'^#\s*source:\s*(.+?\.proto)\s*$', php_code, re.MULTILINE)
-    if source_match:
-        return Path(source_match.group(1)).name
+def get_php_proto_name(header):
+    name = _source_comment_name(_HASH_SOURCE_COMMENT, header)
+    if name:
+        return name
 
-    class_match = re.search(r'class\s+(\w+)\s*\{', php_code)
+    class_match = _PHP_CLASS.search(header)
     if class_match:
-        return f"{class_match.group(1)}.proto"
+        return f"{_text(class_match.group(1))}.proto"
 
     return None
 
 def get_cpp_proto_name(cpp_code):
-    source_match = re.search(r'^//\s*source:\s*(.+?\.proto)\s*$', cpp_code)
-    if source_match:
-        return Path(source_match.group(1)).name
+    name = _source_comment_name(_CPP_SOURCE_COMMENT, cpp_code[:HEADER_SIZE])
+    if name:
+        return name
 
-    pattern = re.compile(
-        r'const\s+char\s+descriptor_table_protodef_(\w+)\[\]',
-        re.DOTALL
-    )
-    match = pattern.search(cpp_code)
-    if match:
-        file_name = match.group(1)
-        file_name = file_name.replace('_2e', '.')
-        file_name = file_name.replace('_5f', '_')
-        return file_name
+    # descriptor_table_protodef_ 数组在描述符处，不在文件头部
+    pos = cpp_code.find(_CPP_PROTODEF)
+    while pos != -1:
+        end = pos + len(_CPP_PROTODEF)
+        if preceded_by(cpp_code, pos, _CPP_PROTODEF_DECLARATION):
+            match = _CPP_PROTODEF_NAME.match(cpp_code, end)
+            if match:
+                file_name = _text(match.group(1))
+                file_name = file_name.replace('_2e', '.')
+                file_name = file_name.replace('_5f', '_')
+                return file_name
+        pos = cpp_code.find(_CPP_PROTODEF, end)
 
     return None
 
-def generate_proto_file(descriptor_data, output_directory, source_code, source_language):
-    output_path = Path(output_directory)
-    output_path.mkdir(parents=True, exist_ok=True)
-
-    generated_files = []
-
-    if source_language == 'php':
-        file_set = FileDescriptorSet()
-        file_set.ParseFromString(descriptor_data)
-
-        for file_proto in file_set.file:
-            proto_content, proto_name_from_descriptor = generate_proto_from_bytes(file_proto.SerializeToString())
-
-            if proto_name_from_descriptor is not None:
-                proto_file_name = proto_name_from_descriptor
-                if isinstance(proto_file_name, bytes):
-                    proto_file_name = proto_file_name.decode("utf-8", errors="ignore")
-            else:
-                proto_file_name = get_proto_file_name(source_code, file_proto, source_language)
-
-            output_file = output_path / proto_file_name
-            output_file.parent.mkdir(parents=True, exist_ok=True)
-
-            with open(output_file, "w", encoding="utf-8") as f:
-                f.write(proto_content)
-
-            print(f"Generated: {output_file}")
-            generated_files.append(str(output_file))
-
-    else:
-        file_descriptor = FileDescriptorProto()
-        file_descriptor.ParseFromString(descriptor_data)
-
-        proto_content, proto_name_from_descriptor = generate_proto_from_bytes(descriptor_data)
-
-        if proto_name_from_descriptor is not None:
-            proto_file_name = proto_name_from_descriptor
-            if isinstance(proto_file_name, bytes):
-                proto_file_name = proto_file_name.decode("utf-8", errors="ignore")
+def parse_file_descriptors(descriptors, source_language):
+    # descriptors 是 extract_descriptor_data 返回的列表，每个描述符只解析一次
+    file_protos = []
+    for descriptor_data in descriptors:
+        if source_language == 'php':
+            file_set = FileDescriptorSet()
+            with span("parse"):
+                file_set.ParseFromString(descriptor_data)
+            file_protos.extend(file_set.file)
         else:
-            proto_file_name = get_proto_file_name(source_code, file_descriptor, source_language)
-
-        output_file = output_path / proto_file_name
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(proto_content)
+            file_descriptor = FileDescriptorProto()
+            with span("parse"):
+                file_descriptor.ParseFromString(descriptor_data)
+            file_protos.append(file_descriptor)
+    return file_protos
+
+def get_output_file_name(source_code, descriptor_name, source_language):
+    # 描述符里有文件名时保留其目录结构
+    return descriptor_name or get_source_proto_file_name(source_code, source_language)
+
+def descriptors_have_names(descriptors, source_language):
+    # 按 wire format 检查每个描述符是否都带文件名，不解析成 Python 对象; 无法识别时当作没有
+    try:
+        for descriptor_data in descriptors:
+            if source_language == 'php':
+                entries = index_file_set(descriptor_data)
+            else:
+                entries = [index_file(descriptor_data)]
+            if not all(entry.name for entry in entries):
+                return False
+    except ValueError:
+        return False
+    return True
+
+def name_source(descriptors, source_code, source_language):
+    # render_proto_files 只在描述符没有文件名时用源码推断文件名，这里返回它实际会用到的部分;
+    # 多进程时这部分要序列化传给工作进程，不必每次都带上整个源码
+    if descriptors_have_names(descriptors, source_language):
+        return None
+    if source_language in ('go', 'cpp') or len(source_code) <= HEADER_SIZE:
+        return source_code
+    return bytes(source_code[:HEADER_SIZE])
+
+def descriptor_kind(source_language):
+    # 缓存键要区分描述符字节是 FileDescriptorSet 还是单个 FileDescriptorProto
+    return "set" if source_language == 'php' else "file"
+
+def render_descriptors(descriptors, source_language):
+    # 返回 [(描述符里的文件名, proto 文本)]，启用缓存时相同的描述符只渲染一次
+    cache = render_cache.active()
+    if cache is not None:
+        key = cache.key(descriptor_kind(source_language), descriptors)
+        rendered = cache.get(key)
+        if rendered is not None:
+            return rendered
+
+    file_protos = parse_file_descriptors(descriptors, source_language)
+
+    # 同一份源码里的所有文件共用一个符号表
+    symbols = SymbolTable(file_protos)
+    rendered = []
+    for file_proto in file_protos:
+        proto_content, _ = generate_proto_from_descriptor(file_proto, symbols)
+        rendered.append((file_proto.name, proto_content))
+
+    if cache is not None and rendered:
+        cache.put(key, rendered)
+    return rendered
+
+def render_proto_files(descriptors, source_code, source_language):
+    return [
+        (get_output_file_name(source_code, descriptor_name, source_language), proto_content)
+        for descriptor_name, proto_content in render_descriptors(descriptors, source_language)
+    ]
+
+def write_proto_file(output_path, proto_file_name, proto_content, source=None):
+    output_file = Path(output_path) / proto_file_name
+
+    with span("write"):
+        writer.write_text(output_file, proto_content, source)
+
+    print(f"Generated: {output_file}")
+    return output_file
+
+def stream_proto_file(output_path, proto_file_name, file_descriptor, symbols=None, source=None):
+    # 边渲染边写入输出文件，不在内存里拼出完整的 proto 文本
+    output_file = Path(output_path) / proto_file_name
+
+    with span("render"):
+        writer.write_stream(output_file, lambda stream: write_proto_content(file_descriptor, stream, symbols), source)
+
+    print(f"Generated: {output_file}")
+    return output_file
+
+def write_cached_files(cache, key, output_directory, output_name, source=None):
+    # 缓存命中时直接写出缓存的文本; output_name 把描述符里的文件名映射为输出文件名
+    rendered = cache.get(key)
+    if rendered is None:
+        return None
+
+    return [
+        str(write_proto_file(output_directory, output_name(descriptor_name), proto_content, source))
+        for descriptor_name, proto_content in rendered
+    ]
+
+def stream_files(file_protos, output_directory, output_name, cache=None, key=None, source=None, symbols=None):
+    if symbols is None:
+        symbols = SymbolTable(file_protos)
+
+    written = []
+    for file_proto in file_protos:
+        output_file = stream_proto_file(output_directory, output_name(file_proto.name), file_proto, symbols, source)
+        written.append((file_proto.name, output_file))
+
+    if cache is not None and written:
+        cache.put_files(key, written)
+    return [str(output_file) for _, output_file in written]
+
+def stream_proto_files(descriptors, output_directory, source_code, source_language):
+    def output_name(descriptor_name):
+        return get_output_file_name(source_code, descriptor_name, source_language)
+
+    cache = render_cache.active()
+    key = None
+    if cache is not None:
+        key = cache.key(descriptor_kind(source_language), descriptors)
+        generated_files = write_cached_files(cache, key, output_directory, output_name)
+        if generated_files is not None:
+            return generated_files
 
-        print(f"Generated: {output_file}")
-        generated_files.append(str(output_file))
+    file_protos = parse_file_descriptors(descriptors, source_language)
+    return stream_files(file_protos, output_directory, output_name, cache, key)
 
-    return generated_files
+def parse_pb_file(file_path: Path, descriptor_data: bytes, selection=None):
+    # 返回 (要渲染的文件, 符号表)。selection 不为空时只解析选中的文件和它们依赖的文件，
+    # 依赖的文件只加入符号表; 先按 wire format 建立索引，建不了索引时完整解析后再筛选
+    if selection is None:
+        file_protos = parse_whole_pb_file(file_path, descriptor_data)
+        return file_protos, SymbolTable(file_protos)
 
-def process_pb_file(file_path: Path, output_path: Path):
-    with open(file_path, "rb") as f:
-        descriptor_data = f.read()
+    parsed = parse_selected_files(descriptor_data, selection)
+    if parsed is None:
+        all_protos = parse_whole_pb_file(file_path, descriptor_data)
+        file_protos = selection.select(all_protos)
+        parsed = file_protos, dependencies(all_protos, file_protos)
 
-    generated_files = []
+    file_protos, dependency_protos = parsed
+    return file_protos, SymbolTable(file_protos + dependency_protos)
 
+def parse_whole_pb_file(file_path: Path, descriptor_data: bytes):
+    # 先按 FileDescriptorSet 解析，失败或为空时再按单个 FileDescriptorProto 解析
     fds = FileDescriptorSet()
     try:
-        fds.ParseFromString(descriptor_data)
+        with span("parse"):
+            fds.ParseFromString(descriptor_data)
         if fds.file:
-            for fd in fds.file:
-                proto_content, proto_name_from_descriptor = generate_proto_from_bytes(fd.SerializeToString())
-
-                proto_name = proto_name_from_descriptor or fd.name or (file_path.stem + ".proto")
-                if isinstance(proto_name, bytes):
-                    proto_name = proto_name.decode("utf-8", errors="ignore")
-
-                output_file = output_path / proto_name
-                output_file.parent.mkdir(parents=True, exist_ok=True)
-
-                with open(output_file, "w", encoding="utf-8") as out_f:
-                    out_f.write(proto_content)
-
-                print(f"Generated: {output_file}")
-                generated_files.append(str(output_file))
-            return generated_files
+            return list(fds.file)
     except Exception:
         pass
 
     try:
-        proto_content, proto_name_from_descriptor = generate_proto_from_bytes(descriptor_data)
-
-        if proto_name_from_descriptor:
-            if isinstance(proto_name_from_descriptor, bytes):
-                proto_name_from_descriptor = proto_name_from_descriptor.decode("utf-8", errors="ignore")
-            proto_file_name = proto_name_from_descriptor
-        else:
-            proto_file_name = file_path.stem + ".proto"
-
-        output_file = output_path / proto_file_name
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(proto_content)
-
-        print(f"Generated: {output_file}")
-        generated_files.append(str(output_file))
+        file_descriptor = FileDescriptorProto()
+        with span("parse"):
+            file_descriptor.ParseFromString(descriptor_data)
+        return [file_descriptor]
     except Exception as e:
         print(f"Failed to process pb file {file_path}: {e}", file=sys.stderr)
+        return []
+
+def get_pb_proto_file_name(file_path: Path, descriptor_name):
+    return descriptor_name or (file_path.stem + ".proto")
+
+def pb_cache_kind(selection):
+    return "pb" if selection is None else f"pb {selection.cache_kind()}"
+
+def render_pb_descriptors(file_path: Path, descriptor_data: bytes, selection=None):
+    cache = render_cache.active()
+    if cache is not None:
+        key = cache.key(pb_cache_kind(selection), (descriptor_data,))
+        rendered = cache.get(key)
+        if rendered is not None:
+            return rendered
+
+    rendered = []
+
+    file_protos, symbols = parse_pb_file(file_path, descriptor_data, selection)
+    for file_proto in file_protos:
+        try:
+            proto_content, _ = generate_proto_from_descriptor(file_proto, symbols)
+        except Exception as e:
+            print(f"Failed to process pb file {file_path}: {e}", file=sys.stderr)
+            return []
+        rendered.append((file_proto.name, proto_content))
+
+    if cache is not None and rendered:
+        cache.put(key, rendered)
+    return rendered
+
+def render_pb_file(file_path: Path, descriptor_data: bytes, selection=None):
+    return [
+        (get_pb_proto_file_name(file_path, descriptor_name), proto_content)
+        for descriptor_name, proto_content in render_pb_descriptors(file_path, descriptor_data, selection)
+    ]
+
+def stream_pb_file(file_path: Path, descriptor_data: bytes, output_path: Path, selection=None):
+    def output_name(descriptor_name):
+        return get_pb_proto_file_name(file_path, descriptor_name)
+
+    cache = render_cache.active()
+    key = None
+    if cache is not None:
+        key = cache.key(pb_cache_kind(selection), (descriptor_data,))
+        generated_files = write_cached_files(cache, key, output_path, output_name, file_path)
+        if generated_files is not None:
+            return generated_files
+
+    file_protos, symbols = parse_pb_file(file_path, descriptor_data, selection)
+    return stream_files(file_protos, output_path, output_name, cache, key, file_path, symbols)
 
-    return generated_files
+def stream_mapped_pb_file(file_path: Path, output_path: Path, selection=None):
+    # 低内存模式: mmap 整个 .pb，逐个 file 条目解析、渲染、写出后再处理下一个。
+    # 第一遍只把各文件的类型名加入符号表，第二遍重新解析条目并流式写出，
+    # 内存中只有符号表、条目索引和当前这一个文件。不经过渲染缓存
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return stream_pb_file(file_path, b"", output_path, selection)
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            try:
+                entries = index_file_set(data)
+            except ValueError:
+                entries = None
+
+            if not entries:
+                # 不是 FileDescriptorSet，按原来的方式完整解析
+                return stream_pb_file(file_path, data[:], output_path, selection)
+
+            symbol_entries = entries
+            if selection is not None:
+                entries = selection.select(entries)
+                # 选中文件依赖的文件不渲染，只加入符号表
+                symbol_entries = entries + dependencies(symbol_entries, entries)
+
+            symbols = SymbolTable()
+            for entry in symbol_entries:
+                symbols.add_file(parse_entry(data, entry))
+
+            generated_files = []
+            for entry in entries:
+                file_proto = parse_entry(data, entry)
+                proto_file_name = get_pb_proto_file_name(file_path, file_proto.name)
+                output_file = stream_proto_file(output_path, proto_file_name, file_proto, symbols, file_path)
+                generated_files.append(str(output_file))
+
+            return generated_files
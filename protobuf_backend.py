@@ -0,0 +1,25 @@
+import sys
+import google.protobuf
+
+# google.protobuf 有 upb、cpp 和纯 Python 三种实现，解析和遍历描述符的速度相差十倍以上。
+# 可以用环境变量 PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION 强制指定
+PYTHON = "python"
+
+def backend():
+    try:
+        from google.protobuf.internal import api_implementation
+        return api_implementation.Type()
+    except (ImportError, AttributeError):
+        return "unknown"
+
+def describe():
+    return f"{backend()} (protobuf {google.protobuf.__version__})"
+
+def report():
+    print(f"Protobuf backend: {describe()}")
+    if backend() == PYTHON:
+        print(
+            "Warning: protobuf is using the pure-Python backend, parsing descriptors will be much slower. "
+            "Install a protobuf release with the upb backend, or unset PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION.",
+            file=sys.stderr,
+        )
@@ -0,0 +1,191 @@
+import os
+import time
+import hashlib
+import tempfile
+from proto_generator import GENERATOR_VERSION
+
+# 按内容寻址的渲染缓存: 键是生成器版本 + 描述符字节的 SHA-256，值是渲染出的 (文件名, proto 文本)。
+# 每个条目一个文件，先写临时文件再 os.replace，多个工作进程同时读写也不会读到半个条目;
+# 命中时更新 mtime，总大小超出预算时按 mtime 从旧到新删除 (LRU)。
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+ENTRY_SUFFIX = ".render"
+TEMP_PREFIX = ".tmp-"
+
+# 淘汰时删到预算的这个比例以下，避免每写一个条目就扫描一次目录
+EVICT_TO = 0.9
+
+# 超过这个时间的临时文件是被中断的写入留下的
+STALE_TEMP_SECONDS = 3600
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+# 条目格式: 每个文件一段 "<16 位字节数> <文件名>\n<UTF-8 文本>"
+_LENGTH_WIDTH = 16
+
+_cache = None
+
+def enable(directory, max_bytes=DEFAULT_MAX_BYTES):
+    global _cache
+    _cache = RenderCache(directory, max_bytes)
+
+def disable():
+    global _cache
+    _cache = None
+
+def init_worker(directory, max_bytes):
+    # 工作进程里各自打开同一个缓存目录
+    enable(directory, max_bytes)
+
+def active():
+    return _cache
+
+def settings():
+    if _cache is None:
+        return None
+    return str(_cache.directory), _cache.max_bytes
+
+class RenderCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # 本进程估计的缓存总大小，第一次写入时扫描目录得到
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, kind, descriptors):
+        # kind 区分同样的字节按哪种消息解析 (FileDescriptorProto / FileDescriptorSet / .pb 文件)
+        digest = hashlib.sha256(f"{GENERATOR_VERSION}\0{kind}\0".encode())
+        for descriptor_data in descriptors:
+            digest.update(len(descriptor_data).to_bytes(8, "little"))
+            digest.update(descriptor_data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        rendered = _parse_entry(data)
+        if rendered is None:
+            # 损坏的条目当作未命中，并删掉让之后重新写入
+            _remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return rendered
+
+    def put(self, key, rendered):
+        # rendered: [(描述符里的文件名, proto 文本)]
+        if sum(len(text) for _, text in rendered) > self.max_bytes:
+            return
+        self._write_entry(key, [(name, (text,)) for name, text in rendered])
+
+    def put_files(self, key, written):
+        # written: [(描述符里的文件名, 已写好的输出文件)]，流式写出时从输出文件复制
+        try:
+            if sum(os.path.getsize(path) for _, path in written) > self.max_bytes:
+                return
+        except OSError:
+            return
+        self._write_entry(key, [(name, _read_text_chunks(path)) for name, path in written])
+
+    def _write_entry(self, key, entries):
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for name, chunks in entries:
+                    # 先占位长度，写完正文再回填
+                    header = f.tell()
+                    f.write(b"0" * _LENGTH_WIDTH + b" " + name.encode("utf-8") + b"\n")
+                    start = f.tell()
+                    for chunk in chunks:
+                        f.write(chunk.encode("utf-8"))
+                    end = f.tell()
+
+                    f.seek(header)
+                    f.write(b"%0*d" % (_LENGTH_WIDTH, end - start))
+                    f.seek(end)
+                size = f.tell()
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            _remove(temp_path)
+            return
+
+        if self._size is None:
+            self._evict()
+        else:
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 其他进程也在写入，淘汰前重新扫描目录得到实际大小
+        entries = []
+        total = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            if entry.name.endswith(ENTRY_SUFFIX):
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            elif entry.name.startswith(TEMP_PREFIX) and now - stat.st_mtime > STALE_TEMP_SECONDS:
+                _remove(entry.path)
+
+        if total > self.max_bytes:
+            limit = self.max_bytes * EVICT_TO
+            entries.sort()
+            for _, size, path in entries:
+                if total <= limit:
+                    break
+                _remove(path)
+                total -= size
+
+        self._size = total
+
+def _parse_entry(data):
+    rendered = []
+    pos = 0
+    try:
+        while pos < len(data):
+            line_end = data.index(b"\n", pos)
+            length = int(data[pos:pos + _LENGTH_WIDTH])
+            name = data[pos + _LENGTH_WIDTH + 1:line_end].decode("utf-8")
+
+            start = line_end + 1
+            end = start + length
+            if end > len(data):
+                return None
+            rendered.append((name, data[start:end].decode("utf-8")))
+            pos = end
+    except ValueError:
+        return None
+    return rendered
+
+def _read_text_chunks(path):
+    # 与写入时一样按文本读取，缓存里统一保存 \n 换行
+    with open(path, "r", encoding="utf-8", newline=None if os.linesep != "\n" else "") as f:
+        while True:
+            chunk = f.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
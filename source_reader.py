@@ -0,0 +1,46 @@
+CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+class PartialSource(bytes):
+    # 只读到描述符结束处的源码前缀; complete 为 False 时文件后面还有内容没读
+    def __new__(cls, data, file_path, complete):
+        source = super().__new__(cls, data)
+        source.file_path = file_path
+        source.complete = complete
+        return source
+
+    def __reduce__(self):
+        # 多进程时需要连同属性一起传给工作进程
+        return PartialSource, (bytes(self), self.file_path, self.complete)
+
+    def read_full(self):
+        if self.complete:
+            return bytes(self)
+        with open(self.file_path, "rb") as f:
+            return f.read()
+
+def read_descriptor_prefix(file_path, anchor, scan, chunk_size=CHUNK_SIZE):
+    # 分块读取，每读一块就在新数据里找锚点; 锚点处的声明完整闭合后停止读取。
+    # 字面量跨块时从同一个锚点重新扫描，块大小逐次翻倍，总扫描量仍与读取量成正比。
+    # 第一个锚点不是描述符时会一直读到文件末尾，结果与完整读取相同。
+    # 只取第一个描述符: 多个源文件合并在一起时，后面的描述符不会被读到
+    data = bytearray()
+    pos = -1
+
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return PartialSource(data, file_path, True)
+
+            search_from = max(0, len(data) - len(anchor) + 1)
+            data += chunk
+
+            if pos == -1:
+                pos = data.find(anchor, search_from)
+
+            if pos != -1:
+                found, _ = scan(data, pos)
+                if found is not None:
+                    return PartialSource(data, file_path, False)
+                chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
@@ -0,0 +1,94 @@
+import re
+
+# 描述符定位用的小型扫描器: 先用 find 找到锚点，再从锚点向后做锚定匹配。
+# 所有正则都用 match(code, pos) 从指定位置开始，并用占有量词，
+# 扫描长度只取决于字面量本身，不会回溯，也不会扫到文件其它部分。
+# code 是 bytes 或只读 mmap，只有定位到的字面量会被复制出来;
+# mmap 没有 startswith，比较统一用切片。
+
+_SPACE = re.compile(rb"\s*")
+_DOUBLE_QUOTED = re.compile(rb'"([^"\\]*+(?:\\.[^"\\]*+)*+)"', re.DOTALL)
+_SINGLE_QUOTED = re.compile(rb"'([^'\\]*+(?:\\.[^'\\]*+)*+)'", re.DOTALL)
+_VERBATIM = re.compile(rb'@"((?:[^"]|"")*+)"')
+
+# 只允许空白、逗号、字符字面量和字符串字面量的初始化列表，如 C++ 的 { 'a', '\n', ... } 或 { "..." "..." }
+_INITIALIZER_BODY = re.compile(rb"""(?:\s++|,|'[^'\\]*+(?:\\.[^'\\]*+)*+'|"[^"\\]*+(?:\\.[^"\\]*+)*+")*+""", re.DOTALL)
+
+LOOKBEHIND_WINDOW = 256
+
+_literal_run_regexes = {}
+
+def skip_space(code, pos):
+    return _SPACE.match(code, pos).end()
+
+def at(code, pos, token):
+    return code[pos:pos + len(token)] == token
+
+def expect(code, pos, token):
+    pos = skip_space(code, pos)
+    if at(code, pos, token):
+        return pos + len(token)
+    return -1
+
+def preceded_by(code, pos, pattern):
+    # pattern 需要以 $ 结尾，只在锚点前的一小段窗口内匹配
+    return pattern.search(code, max(0, pos - LOOKBEHIND_WINDOW), pos) is not None
+
+def locate_all(code, anchor, scan):
+    # scan(code, pos) 从锚点 pos 开始识别，返回 (结果或 None, 已扫描到的位置);
+    # 下一次查找从已扫描位置之后开始，锚点出现在字面量内部时也不会重复扫描
+    pos = code.find(anchor)
+    while pos != -1:
+        found, end = scan(code, pos)
+        if found is not None:
+            yield found
+        pos = code.find(anchor, max(end, pos + len(anchor)))
+
+def scan_string(code, pos, quote=b'"'):
+    regex = _DOUBLE_QUOTED if quote == b'"' else _SINGLE_QUOTED
+    match = regex.match(code, skip_space(code, pos))
+    if match is None:
+        return None, pos
+    return match.group(1), match.end()
+
+def scan_verbatim_string(code, pos):
+    match = _VERBATIM.match(code, skip_space(code, pos))
+    if match is None:
+        return None, pos
+    return match.group(1).replace(b'""', b'"'), match.end()
+
+def _literal_run_regex(separators, quote):
+    key = (separators, quote)
+    regex = _literal_run_regexes.get(key)
+    if regex is None:
+        literal = (_DOUBLE_QUOTED if quote == b'"' else _SINGLE_QUOTED).pattern.replace(b"(", b"(?:", 1)
+        joiner = rb"\s*+[" + re.escape(separators) + rb"]?\s*+" if separators else rb"\s*+"
+        regex = _literal_run_regexes[key] = re.compile(
+            rb"\s*+" + literal + rb"(?:" + joiner + literal + rb")*+", re.DOTALL
+        )
+    return regex
+
+def scan_string_sequence(code, pos, separators=b"", quote=b'"'):
+    # 连续的字符串字面量，中间可以有空白和 separators 中的连接符 (如 Java/Go 的 +，数组的 ,)。
+    # 先用一个占有量词正则确定整段的结束位置，再在这段范围内 findall 取出各片段，
+    # 不复制源码，也不会越过这段表达式去收集后面无关的字符串
+    run = _literal_run_regex(separators, quote).match(code, pos)
+    if run is None:
+        return [], pos
+
+    regex = _DOUBLE_QUOTED if quote == b'"' else _SINGLE_QUOTED
+    fragments = regex.findall(code, pos, run.end())
+
+    # 末尾的连接符 (如数组最后一项后的逗号) 也算在这段表达式里
+    end = skip_space(code, run.end())
+    if end < len(code) and code[end:end + 1] in separators:
+        return fragments, end + 1
+    return fragments, run.end()
+
+def scan_initializer(code, pos):
+    # pos 指向 { 之后，返回 (初始化列表内容, } 之后的位置)
+    body = _INITIALIZER_BODY.match(code, pos)
+    end = body.end()
+    if not at(code, end, b"}"):
+        return None, pos
+    return code[pos:end], end + 1
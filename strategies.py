@@ -0,0 +1,90 @@
+import threading
+from collections import Counter
+
+# 同一种语言的描述符有多种生成格式，各格式作为一个策略按顺序尝试。
+# 同一个代码库几乎总是同一个生成器版本，按本次运行的命中次数把最常命中的策略排到前面。
+_strategy_sets = {}
+
+class StrategySet:
+    __slots__ = ("name", "strategies", "hits", "unreported", "_lock")
+
+    def __init__(self, name, strategies):
+        # strategies: [(策略名, 函数)]，函数未命中时返回 None
+        self.name = name
+        self.strategies = list(strategies)
+        self.hits = dict.fromkeys((strategy_name for strategy_name, _ in self.strategies), 0)
+        self.unreported = Counter()
+        # 多个 extract 线程会同时计数和合并工作进程的命中次数; 读取 (peek) 不加锁
+        self._lock = threading.Lock()
+        _strategy_sets[name] = self
+
+    def __call__(self, *args):
+        for strategy_name, func in self.strategies:
+            result = func(*args)
+            if result is not None:
+                self._hit(strategy_name)
+                return result
+        return None
+
+    def peek(self, *args):
+        # 只判断是否有策略命中，不计入统计
+        for _, func in self.strategies:
+            result = func(*args)
+            if result is not None:
+                return result
+        return None
+
+    def _hit(self, strategy_name):
+        with self._lock:
+            self.hits[strategy_name] += 1
+            self.unreported[strategy_name] += 1
+
+            # 保持按命中次数降序，次数相同时维持原有顺序。
+            # 读取线程会同时通过 peek 遍历 self.strategies，只在副本上调整顺序再整体替换，不原地修改
+            hits = self.hits
+            index = next(index for index, (name, _) in enumerate(self.strategies) if name == strategy_name)
+            if index == 0 or hits[strategy_name] <= hits[self.strategies[index - 1][0]]:
+                return
+
+            strategies = list(self.strategies)
+            while index > 0 and hits[strategy_name] > hits[strategies[index - 1][0]]:
+                strategies[index - 1], strategies[index] = strategies[index], strategies[index - 1]
+                index -= 1
+            self.strategies = strategies
+
+    def add_hits(self, hits):
+        with self._lock:
+            for strategy_name, count in hits.items():
+                self.hits[strategy_name] += count
+            # sorted 生成新列表; 原地 sort 期间列表看起来是空的，并发的 peek 会误判为未命中
+            self.strategies = sorted(self.strategies, key=lambda strategy: -self.hits[strategy[0]])
+
+def drain_hits():
+    # 工作进程把本进程新增的命中次数交回主进程
+    drained = {}
+    for name, strategy_set in _strategy_sets.items():
+        if strategy_set.unreported:
+            drained[name] = dict(strategy_set.unreported)
+            strategy_set.unreported.clear()
+    return drained
+
+def merge_hits(drained):
+    for name, hits in drained.items():
+        _strategy_sets[name].add_hits(hits)
+
+def summary():
+    lines = []
+    for name, strategy_set in _strategy_sets.items():
+        total = sum(strategy_set.hits.values())
+        if not total:
+            continue
+
+        rates = ", ".join(
+            f"{strategy_name} {count / total:.0%}"
+            for strategy_name, count in sorted(strategy_set.hits.items(), key=lambda item: -item[1])
+        )
+        lines.append(f"  {name}: {rates} ({total} hits)")
+
+    if not lines:
+        return ""
+    return "Extractor strategies:\n" + "\n".join(lines)
@@ -0,0 +1,103 @@
+# 全限定名 (带前导点，如 .game.Player.Inner) -> 种类。
+# 一个描述符集合只建一次，集合内所有文件共用; 类型引用按 protoc 的作用域规则
+# 找出能唯一解析到目标的最短写法，结果按 (引用, 作用域) 缓存。
+PACKAGE = "package"
+MESSAGE = "message"
+ENUM = "enum"
+SERVICE = "service"
+
+# 只在引用里出现、集合中没有定义的名字 (如 google/protobuf/any.proto 里的类型)。
+# 在 add_file 里随定义一起登记，qualify 不修改符号表，结果与渲染顺序无关。
+# 这些类型定义在集合之外，那里的其它定义可能遮住任何缩写，引用时总是写成带前导点的全限定名
+REFERENCED = "referenced"
+REFERENCED_SCOPE = "referenced scope"
+
+_TYPES = (MESSAGE, ENUM, REFERENCED)
+_REFERENCES = (REFERENCED, REFERENCED_SCOPE)
+
+class SymbolTable:
+    def __init__(self, file_descriptors=()):
+        self.symbols = {}
+        self._qualified = {}
+        for file_descriptor in file_descriptors:
+            self.add_file(file_descriptor)
+
+    def add_file(self, file_descriptor):
+        package = f".{file_descriptor.package}" if file_descriptor.package else ""
+        self._add_scope(package, PACKAGE)
+
+        for enum in file_descriptor.enum_type:
+            self._add(f"{package}.{enum.name}", ENUM)
+        for message in file_descriptor.message_type:
+            self._add_message(message, package)
+        for service in file_descriptor.service:
+            self._add(f"{package}.{service.name}", SERVICE)
+
+        self._qualified.clear()
+
+    def _add(self, full_name, kind):
+        # 同名定义以先出现的为准; 之前只在引用里出现的名字换成定义
+        if self.symbols.get(full_name, REFERENCED) in _REFERENCES:
+            self.symbols[full_name] = kind
+
+    def _add_scope(self, scope, kind):
+        # 包名的每一级前缀都是一个符号: .a.b.c -> .a.b.c, .a.b, .a
+        while scope:
+            existing = self.symbols.get(scope)
+            if existing is not None and (kind in _REFERENCES or existing not in _REFERENCES):
+                break
+            self.symbols[scope] = kind
+            scope = scope.rpartition(".")[0]
+
+    def _add_reference(self, type_name):
+        if type_name.startswith(".") and type_name not in self.symbols:
+            self.symbols[type_name] = REFERENCED
+            self._add_scope(type_name.rpartition(".")[0], REFERENCED_SCOPE)
+
+    def _add_message(self, message, scope):
+        full_name = f"{scope}.{message.name}"
+        self._add(full_name, MESSAGE)
+
+        for enum in message.enum_type:
+            self._add(f"{full_name}.{enum.name}", ENUM)
+        for nested in message.nested_type:
+            self._add_message(nested, full_name)
+        for field in message.field:
+            if field.type_name:
+                self._add_reference(field.type_name)
+
+    def qualify(self, type_name, scope):
+        # type_name 是描述符里的全限定引用，scope 是引用所在 message 的全限定名
+        key = (type_name, scope)
+        qualified = self._qualified.get(key)
+        if qualified is None:
+            qualified = self._qualified[key] = self._qualify(type_name, scope)
+        return qualified
+
+    def _qualify(self, type_name, scope):
+        if not type_name.startswith(".") or self.symbols.get(type_name, REFERENCED) == REFERENCED:
+            return type_name
+
+        parts = type_name[1:].split(".")
+        for count in range(1, len(parts) + 1):
+            candidate = ".".join(parts[-count:])
+            if self.resolve(candidate, scope) == type_name:
+                return candidate
+        return type_name
+
+    def resolve(self, name, scope):
+        # protoc 的查找规则: 从最内层作用域向外找名字的第一段;
+        # 单段名字必须找到类型，多段名字找到第一段后剩余部分只在那里继续解析，不再回退
+        first, _, rest = name.partition(".")
+        while True:
+            kind = self.symbols.get(f"{scope}.{first}")
+            if kind is not None:
+                if rest:
+                    full_name = f"{scope}.{name}"
+                    return full_name if full_name in self.symbols else None
+                if kind in _TYPES:
+                    return f"{scope}.{first}"
+
+            if not scope:
+                return None
+            scope = scope.rpartition(".")[0]
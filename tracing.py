@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import threading
+from contextlib import nullcontext
+
+# Chrome trace event 格式，可以直接在 chrome://tracing 或 ui.perfetto.dev 中打开
+_events = None
+_lock = threading.Lock()
+_local = threading.local()
+_named_threads = set()
+_NULL_SPAN = nullcontext()
+
+def enable():
+    global _events
+    if _events is None:
+        _events = []
+
+def init_worker():
+    # fork 出来的工作进程会继承主进程已记录的事件，需要重新开始
+    global _events
+    _events = []
+    _named_threads.clear()
+    threading.current_thread().name = "worker"
+
+def is_enabled():
+    return _events is not None
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.monotonic_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.monotonic_ns()
+        if exc_type is not None:
+            self.args["error"] = str(exc)
+        _record(self.name, self.start, end, self.args)
+        return False
+
+def span(name, **args):
+    if _events is None:
+        return _NULL_SPAN
+
+    file_path = getattr(_local, "file_path", None)
+    if file_path is not None and "file" not in args:
+        args["file"] = file_path
+    return _Span(name, args)
+
+class current_file:
+    __slots__ = ("file_path", "previous")
+
+    def __init__(self, file_path):
+        self.file_path = str(file_path)
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(_local, "file_path", None)
+        _local.file_path = self.file_path
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.file_path = self.previous
+        return False
+
+def _record(name, start, end, args):
+    pid = os.getpid()
+    tid = threading.get_ident()
+    event = {
+        "name": name,
+        "ph": "X",
+        "ts": start / 1000,
+        "dur": (end - start) / 1000,
+        "pid": pid,
+        "tid": tid,
+        "args": args,
+    }
+
+    with _lock:
+        if (pid, tid) not in _named_threads:
+            _named_threads.add((pid, tid))
+            _events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": threading.current_thread().name},
+            })
+        _events.append(event)
+
+def drain():
+    # 工作进程把自己记录的事件交回主进程
+    if _events is None:
+        return []
+
+    with _lock:
+        events = _events[:]
+        _events.clear()
+    return events
+
+def extend(events):
+    if _events is None or not events:
+        return
+
+    with _lock:
+        _events.extend(events)
+
+def traced_call(file_path, func, *args):
+    with current_file(file_path):
+        result = func(*args)
+    return result, drain()
+
+def write_trace(path):
+    if _events is None:
+        return
+
+    pid = os.getpid()
+    with _lock:
+        events = list(_events)
+
+    process_names = {}
+    for event in events:
+        process_names.setdefault(event["pid"], "main" if event["pid"] == pid else f"worker-{event['pid']}")
+
+    metadata = [
+        {"name": "process_name", "ph": "M", "pid": event_pid, "tid": 0, "args": {"name": name}}
+        for event_pid, name in process_names.items()
+    ]
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)